@@ -1,5 +1,8 @@
 import os
+from contextvars import ContextVar
+from typing import Optional
 from dotenv import load_dotenv
+from fastapi import Request
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 
 load_dotenv()
@@ -9,7 +12,59 @@ DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./intune_diagnosti
 SQL_ECHO = os.getenv("SQL_ECHO", "0").lower() in ("1", "true", "yes")
 engine = create_async_engine(DATABASE_URL, echo=SQL_ECHO)
 async_session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+# Autocommit branch of the same pool for read-only routes: their SELECTs run
+# without the BEGIN/COMMIT (or ROLLBACK) round-trips of a managed transaction
+read_only_session_maker = async_sessionmaker(
+    engine.execution_options(isolation_level="AUTOCOMMIT"),
+    class_=AsyncSession,
+    expire_on_commit=False,
+)
 
-async def get_db():
+async def get_db(request: Request):
     async with async_session_maker() as session:
-        yield session
\ No newline at end of file
+        # Exposed so the app-level SQLAlchemyError handler can roll it back
+        request.state.db = session
+        yield session
+
+# Request-scoped session for routes that open it lazily via current_session();
+# requests that never touch the database never borrow a pooled connection
+_request_session: ContextVar[Optional[AsyncSession]] = ContextVar("request_session", default=None)
+_session_factory: ContextVar[async_sessionmaker] = ContextVar("session_factory", default=async_session_maker)
+
+def current_session() -> AsyncSession:
+    """Return this request's session, creating it on first use"""
+    session = _request_session.get()
+    if session is None:
+        session = _session_factory.get()()
+        _request_session.set(session)
+    return session
+
+def peek_session() -> Optional[AsyncSession]:
+    """Return this request's session if one was opened, without creating it"""
+    return _request_session.get()
+
+async def use_read_only_session():
+    """Route dependency: serve current_session() from the autocommit read engine"""
+    _session_factory.set(read_only_session_maker)
+
+class RequestSessionMiddleware:
+    """ASGI middleware that scopes current_session() to a request and closes it"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = _request_session.set(None)
+        factory_token = _session_factory.set(async_session_maker)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            session = _request_session.get()
+            _request_session.reset(token)
+            _session_factory.reset(factory_token)
+            if session is not None:
+                await session.close()
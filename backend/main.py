@@ -33,16 +33,18 @@ mcp_logger = logging.getLogger("mcp.client.stdio")
 mcp_logger.addFilter(MCPJsonRpcFilter())
 
 load_dotenv()
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.security import HTTPBearer
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from azure.identity import DefaultAzureCredential
 
 from models.database import Base
 from routers import auth, settings, diagnostics
 from services.autogen_service import AgentService
-from dependencies import engine, get_db
+from dependencies import engine, get_db, peek_session, RequestSessionMiddleware
 
 
 security = HTTPBearer()
@@ -73,6 +75,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Closes sessions opened lazily through dependencies.current_session()
+app.add_middleware(RequestSessionMiddleware)
+
+@app.exception_handler(SQLAlchemyError)
+async def sqlalchemy_error_handler(request: Request, exc: SQLAlchemyError):
+    """Roll back the request's session and map database failures to HTTP 500"""
+    db = getattr(request.state, "db", None) or peek_session()
+    if db is not None:
+        await db.rollback()
+    return JSONResponse(status_code=500, content={"detail": f"Database error: {exc}"})
+
 async def init_db():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
@@ -18,6 +18,9 @@ class User(Base):
 
 class ModelConfiguration(Base):
     __tablename__ = "model_configurations"
+    # Populate id/created_at/updated_at from the INSERT's RETURNING clause
+    # (or a post-INSERT SELECT on backends without it) instead of a refresh()
+    __mapper_args__ = {"eager_defaults": True}
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, nullable=False, index=True)
@@ -33,6 +36,9 @@ class ModelConfiguration(Base):
 
 class AgentConfiguration(Base):
     __tablename__ = "agent_configurations"
+    # Populate id/created_at/updated_at from the INSERT's RETURNING clause
+    # (or a post-INSERT SELECT on backends without it) instead of a refresh()
+    __mapper_args__ = {"eager_defaults": True}
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, nullable=False, index=True)
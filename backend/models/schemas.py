@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, TypedDict
 from pydantic import BaseModel, Field
 
 class UserBase(BaseModel):
@@ -78,6 +78,12 @@ class TableData(BaseModel):
     rows: List[List[Any]]
     total_rows: int
 
+class NormalizedResult(TypedDict, total=False):
+    """Shape of an MCP tool result after KustoMCPService._normalize_tool_result"""
+    success: bool
+    table: Dict[str, Any]
+    error: str
+
 class AgentResponse(BaseModel):
     response: str
     table_data: Optional[TableData] = None  # First / primary table (backward compatibility)
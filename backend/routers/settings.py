@@ -1,7 +1,8 @@
-from typing import List
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Set
 from fastapi import APIRouter, HTTPException, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, insert, update, delete, text
 from models.database import ModelConfiguration, AgentConfiguration
 from models.schemas import (
     ModelConfiguration as ModelConfigSchema,
@@ -12,141 +13,220 @@ from models.schemas import (
 
 router = APIRouter()
 
-from dependencies import get_db
+from dependencies import engine, current_session, use_read_only_session
+
+# Pure reads; included into ``router`` at the bottom of the module
+read_router = APIRouter(dependencies=[Depends(use_read_only_session)])
+
+# Read endpoints select just the schema's columns with Core and validate the
+# row mappings directly, skipping ORM instance construction and bookkeeping
+_MODEL_COLUMNS = [ModelConfiguration.__table__.c[name] for name in ModelConfigSchema.model_fields]
+_AGENT_COLUMNS = [AgentConfiguration.__table__.c[name] for name in AgentConfigSchema.model_fields]
+
+# Mapped attribute names, computed once; request payloads are dumped straight
+# to these keys so the ORM constructor never sees an unmapped keyword
+_MODEL_ATTRS = frozenset(ModelConfiguration.__mapper__.attrs.keys())
+_AGENT_ATTRS = frozenset(AgentConfiguration.__mapper__.attrs.keys())
+
+# In-flight read coalescing: concurrent identical GETs (e.g. dashboard polling)
+# await a single query instead of each borrowing a DB connection
+_inflight: Dict[tuple, asyncio.Future] = {}
+
+class _LeaderCancelled(Exception):
+    """The request running a coalesced load was cancelled; waiters retry the load"""
+
+async def _coalesce(key: tuple, load: Callable[[], Awaitable[Any]]) -> Any:
+    """Run ``load`` once per key; concurrent callers share its result"""
+    while (pending := _inflight.get(key)) is not None:
+        try:
+            return await asyncio.shield(pending)
+        except _LeaderCancelled:
+            # The leader's session is going away with its request; one waiter takes over
+            continue
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        result = await load()
+        future.set_result(result)
+        return result
+    except Exception as e:
+        future.set_exception(e)
+        # Mark as retrieved so a future nobody waited on does not log a warning
+        future.exception()
+        raise
+    finally:
+        _inflight.pop(key, None)
+        if not future.done():
+            # Leader cancelled (e.g. client disconnect): hand the load to a waiter
+            # rather than cancelling every request that was sharing it
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+
+async def _commit_clearing_defaults(db: AsyncSession, user_ids: Set[int], keep_ids: Set[int]):
+    """Commit pending changes, unsetting is_default on the users' other model configurations.
+
+    Normally the flag reset joins the row write in one transaction. On Postgres it
+    runs as a second transaction that skips waiting for the WAL flush: a crash can
+    only lose this flag change, leaving two defaults visible until one is picked again.
+    """
+    if not user_ids:
+        await db.commit()
+        return
+    clear_defaults = (
+        update(ModelConfiguration)
+        .where(ModelConfiguration.user_id.in_(user_ids))
+        .where(ModelConfiguration.id.not_in(keep_ids))
+        .where(ModelConfiguration.is_default.is_(True))
+        .values(is_default=False)
+    )
+    if engine.dialect.name == "postgresql":
+        await db.commit()
+        await db.execute(text("SET LOCAL synchronous_commit = off"))
+    await db.execute(clear_defaults)
+    await db.commit()
 
 # Model Configuration endpoints
 @router.post("/models", response_model=ModelConfigSchema)
-async def create_model_config(
-    config: ModelConfigurationCreate, 
-    db: AsyncSession = Depends(get_db)
-):
+async def create_model_config(config: ModelConfigurationCreate):
     """Create a new model configuration"""
-    try:
-        # If this is set as default, unset other defaults for this user
-        if config.is_default:
-            await db.execute(
-                update(ModelConfiguration)
-                .where(ModelConfiguration.user_id == config.user_id)
-                .values(is_default=False)
-            )
-        
-        new_config = ModelConfiguration(**config.dict())
-        db.add(new_config)
+    db = current_session()
+    new_config = ModelConfiguration(**config.model_dump(include=_MODEL_ATTRS))
+    db.add(new_config)
+    
+    # If this is set as default, unset other defaults for this user
+    if config.is_default:
+        await db.flush()  # assigns new_config.id so the reset can skip it
+        await _commit_clearing_defaults(db, {config.user_id}, {new_config.id})
+    else:
         await db.commit()
-        await db.refresh(new_config)
-        return new_config
     
-    except Exception as e:
-        await db.rollback()
-        raise HTTPException(status_code=500, detail=f"Failed to create model configuration: {str(e)}")
+    return new_config
 
-@router.get("/models", response_model=List[ModelConfigSchema])
-async def get_model_configs(user_id: int, db: AsyncSession = Depends(get_db)):
-    """Get all model configurations for a user"""
-    result = await db.execute(
-        select(ModelConfiguration).where(ModelConfiguration.user_id == user_id)
+@router.post("/models/bulk", response_model=List[ModelConfigSchema])
+async def create_model_configs_bulk(configs: List[ModelConfigurationCreate]):
+    """Create several model configurations in a single INSERT ... RETURNING"""
+    if not configs:
+        return []
+    
+    db = current_session()
+    result = await db.scalars(
+        insert(ModelConfiguration).returning(ModelConfiguration),
+        [c.model_dump(include=_MODEL_ATTRS) for c in configs]
+    )
+    new_configs = result.all()
+    
+    # Unset existing defaults for every user that got a new default
+    new_defaults = [c for c in new_configs if c.is_default]
+    await _commit_clearing_defaults(
+        db, {c.user_id for c in new_defaults}, {c.id for c in new_defaults}
     )
-    return result.scalars().all()
+    
+    return new_configs
+
+@read_router.get("/models", response_model=List[ModelConfigSchema])
+async def get_model_configs(user_id: int):
+    """Get all model configurations for a user"""
+    async def load():
+        result = await current_session().execute(
+            select(*_MODEL_COLUMNS).where(ModelConfiguration.user_id == user_id)
+        )
+        return tuple(ModelConfigSchema.model_validate(row) for row in result.mappings())
 
-@router.get("/models/{config_id}", response_model=ModelConfigSchema)
-async def get_model_config(config_id: int, db: AsyncSession = Depends(get_db)):
+    return await _coalesce(("models_by_user", user_id), load)
+
+@read_router.get("/models/{config_id}", response_model=ModelConfigSchema)
+async def get_model_config(config_id: int):
     """Get a specific model configuration"""
+    db = current_session()
     result = await db.execute(
-        select(ModelConfiguration).where(ModelConfiguration.id == config_id)
+        select(*_MODEL_COLUMNS).where(ModelConfiguration.id == config_id)
     )
-    config = result.scalar_one_or_none()
+    row = result.mappings().one_or_none()
     
-    if not config:
+    if row is None:
         raise HTTPException(status_code=404, detail="Model configuration not found")
     
-    return config
+    return ModelConfigSchema.model_validate(row)
 
 @router.put("/models/{config_id}", response_model=ModelConfigSchema)
 async def update_model_config(
     config_id: int, 
-    config_update: ModelConfigurationCreate,
-    db: AsyncSession = Depends(get_db)
+    config_update: ModelConfigurationCreate
 ):
     """Update a model configuration"""
-    try:
-        # Get existing config
-        result = await db.execute(
-            select(ModelConfiguration).where(ModelConfiguration.id == config_id)
-        )
-        existing_config = result.scalar_one_or_none()
-        
-        if not existing_config:
-            raise HTTPException(status_code=404, detail="Model configuration not found")
-        
-        # If this is set as default, unset other defaults for this user
-        if config_update.is_default:
-            await db.execute(
-                update(ModelConfiguration)
-                .where(ModelConfiguration.user_id == config_update.user_id)
-                .where(ModelConfiguration.id != config_id)
-                .values(is_default=False)
-            )
-        
-        # Update the configuration
-        update_data = config_update.dict(exclude_unset=True)
-        await db.execute(
-            update(ModelConfiguration)
-            .where(ModelConfiguration.id == config_id)
-            .values(**update_data)
-        )
-        
-        await db.commit()
-        
-        # Return updated config
-        result = await db.execute(
-            select(ModelConfiguration).where(ModelConfiguration.id == config_id)
-        )
-        return result.scalar_one()
+    db = current_session()
+    # Get existing config
+    existing_config = await db.get(ModelConfiguration, config_id)
     
-    except Exception as e:
-        await db.rollback()
-        raise HTTPException(status_code=500, detail=f"Failed to update model configuration: {str(e)}")
+    if not existing_config:
+        raise HTTPException(status_code=404, detail="Model configuration not found")
+    
+    # Update the configuration
+    update_data = config_update.model_dump(include=_MODEL_ATTRS, exclude_unset=True)
+    await db.execute(
+        update(ModelConfiguration)
+        .where(ModelConfiguration.id == config_id)
+        .values(**update_data)
+    )
+    
+    # If this is set as default, unset other defaults for this user
+    await _commit_clearing_defaults(
+        db, {config_update.user_id} if config_update.is_default else set(), {config_id}
+    )
+    
+    # Return updated config; populate_existing overwrites the identity-map copy
+    # loaded above with the post-UPDATE row (including updated_at)
+    return await db.get(ModelConfiguration, config_id, populate_existing=True)
 
 @router.delete("/models/{config_id}")
-async def delete_model_config(config_id: int, db: AsyncSession = Depends(get_db)):
+async def delete_model_config(config_id: int):
     """Delete a model configuration"""
-    try:
-        result = await db.execute(
-            delete(ModelConfiguration).where(ModelConfiguration.id == config_id)
-        )
-        
-        if result.rowcount == 0:
-            raise HTTPException(status_code=404, detail="Model configuration not found")
-        
-        await db.commit()
-        return {"message": "Model configuration deleted successfully"}
+    db = current_session()
+    result = await db.execute(
+        delete(ModelConfiguration).where(ModelConfiguration.id == config_id)
+    )
     
-    except Exception as e:
-        await db.rollback()
-        raise HTTPException(status_code=500, detail=f"Failed to delete model configuration: {str(e)}")
+    if result.rowcount == 0:
+        raise HTTPException(status_code=404, detail="Model configuration not found")
+    
+    await db.commit()
+    return {"message": "Model configuration deleted successfully"}
 
 # Agent Configuration endpoints
 @router.post("/agents", response_model=AgentConfigSchema)
-async def create_agent_config(
-    config: AgentConfigurationCreate,
-    db: AsyncSession = Depends(get_db)
-):
+async def create_agent_config(config: AgentConfigurationCreate):
     """Create a new agent configuration"""
-    try:
-        new_config = AgentConfiguration(**config.dict())
-        db.add(new_config)
-        await db.commit()
-        await db.refresh(new_config)
-        return new_config
-    
-    except Exception as e:
-        await db.rollback()
-        raise HTTPException(status_code=500, detail=f"Failed to create agent configuration: {str(e)}")
+    db = current_session()
+    new_config = AgentConfiguration(**config.model_dump(include=_AGENT_ATTRS))
+    db.add(new_config)
+    await db.commit()
+    return new_config
 
-@router.get("/agents", response_model=List[AgentConfigSchema])
-async def get_agent_configs(user_id: int, db: AsyncSession = Depends(get_db)):
+@read_router.get("/agents", response_model=List[AgentConfigSchema])
+async def get_agent_configs(user_id: int):
     """Get all agent configurations for a user"""
-    result = await db.execute(
-        select(AgentConfiguration).where(AgentConfiguration.user_id == user_id)
+    async def load():
+        result = await current_session().execute(
+            select(*_AGENT_COLUMNS).where(AgentConfiguration.user_id == user_id)
+        )
+        return tuple(AgentConfigSchema.model_validate(row) for row in result.mappings())
+
+    return await _coalesce(("agents_by_user", user_id), load)
+
+@router.post("/agents/bulk", response_model=List[AgentConfigSchema])
+async def create_agent_configs_bulk(configs: List[AgentConfigurationCreate]):
+    """Create several agent configurations in a single INSERT ... RETURNING"""
+    if not configs:
+        return []
+    
+    db = current_session()
+    result = await db.scalars(
+        insert(AgentConfiguration).returning(AgentConfiguration),
+        [c.model_dump(include=_AGENT_ATTRS) for c in configs]
     )
-    return result.scalars().all()
\ No newline at end of file
+    new_configs = result.all()
+    await db.commit()
+    return new_configs
+
+router.include_router(read_router)
@@ -11,91 +11,310 @@ Migration Notes:
 - Supports all existing tools, MCP integration, and scenario lookup
 """
 
+from __future__ import annotations
+
+import asyncio
+import functools
+import hashlib
+import itertools
 import json
 import logging
+import operator
+import os
 import re
-from collections.abc import Awaitable, Callable
-from typing import Any, TypeAlias
+import sys
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from collections.abc import Awaitable, Callable, Sequence
+from typing import TYPE_CHECKING, Any, TypeAlias
 
 # Agent Framework imports (equivalent to Autogen)
 # The agent-framework package provides the core chat agent functionality
 # Documentation: https://github.com/microsoft/agent-framework/tree/main/python
-from agent_framework import (
-    ChatAgent,
-    MagenticAgentDeltaEvent,
-    MagenticAgentMessageEvent,
-    MagenticBuilder,
-    MagenticFinalResultEvent,
-    MagenticOrchestratorMessageEvent,
-    WorkflowOutputEvent,
-)
-from agent_framework.azure import AzureOpenAIChatClient
-from models.schemas import ModelConfiguration
+# These pull in the Azure SDK, so they are imported where first used (and via
+# __getattr__ below for external access) rather than when this module loads.
+if TYPE_CHECKING:
+    from agent_framework import (
+        ChatAgent,
+        ChatMessage,
+        MagenticAgentDeltaEvent,
+        MagenticAgentMessageEvent,
+        MagenticBuilder,
+        MagenticFinalResultEvent,
+        MagenticOrchestratorMessageEvent,
+        WorkflowOutputEvent,
+    )
+    from agent_framework.azure import AzureOpenAIChatClient
+from models.schemas import ModelConfiguration, NormalizedResult
 from services.auth_service import auth_service
 from services.scenario_lookup_service import get_scenario_service
 
 # Logging is configured in main.py
 logger = logging.getLogger(__name__)
 
+# orjson is pulled in transitively (langchain/langsmith); fall back to stdlib json if absent.
+# MCP tool results can carry large Kusto tables, so (de)serialization speed matters there.
+try:
+    import orjson
+
+    def _dumps(obj: Any) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def _loads(data: str | bytes) -> Any:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # stdlib accepts a few extensions orjson rejects (NaN/Infinity, lone surrogates)
+            return json.loads(data)
+except ImportError:  # pragma: no cover - depends on environment
+    def _dumps(obj: Any) -> str:
+        # Same compact, non-ASCII-preserving output orjson produces
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+    def _loads(data: str | bytes) -> Any:
+        return json.loads(data)
+
 # Buffer to hold recent MCP tool normalized results (tables) because Agent Framework
 # streaming events are not currently exposing function result payloads needed for
 # table reconstruction. This allows a fallback after workflow completion.
-TOOL_RESULTS_BUFFER: list[dict[str, Any]] = []
+# Held per request in a context variable so concurrent chat/query_diagnostics calls
+# cannot read each other's results, and bounded so a long run cannot grow it unchecked.
+TOOL_RESULTS_MAXLEN = int(os.getenv("TOOL_RESULTS_MAXLEN", "64"))
+TOOL_RESULTS_BUFFER: ContextVar[deque[dict[str, Any]]] = ContextVar("tool_results_buffer")
 
-# Define the Union type for Magentic callback events
-MagenticCallbackEvent: TypeAlias = (
-    MagenticOrchestratorMessageEvent
-    | MagenticAgentDeltaEvent
-    | MagenticAgentMessageEvent
-    | MagenticFinalResultEvent
+
+def _new_tool_results_buffer() -> deque[dict[str, Any]]:
+    """Start a fresh tool results buffer for the current request context"""
+    buffer: deque[dict[str, Any]] = deque(maxlen=max(1, TOOL_RESULTS_MAXLEN))
+    TOOL_RESULTS_BUFFER.set(buffer)
+    return buffer
+
+
+def _tool_results_buffer() -> deque[dict[str, Any]]:
+    """Return the current context's tool results buffer, creating it on first use"""
+    try:
+        return TOOL_RESULTS_BUFFER.get()
+    except LookupError:
+        return _new_tool_results_buffer()
+
+# Upper bound on scenario queries in flight at once against the shared MCP session
+SCENARIO_QUERY_CONCURRENCY = int(os.getenv("SCENARIO_QUERY_CONCURRENCY", "4"))
+
+# Chat history: only the most recent turns are sent verbatim; every older turn is
+# condensed locally into one summary message (identifiers and user requests), so the
+# prompt grows with the number of distinct requests/IDs rather than with full turn text
+CHAT_HISTORY_VERBATIM_TURNS = int(os.getenv("CHAT_HISTORY_VERBATIM_TURNS", "6"))
+
+# Strict-mode constraints sent as a fixed leading system message when chat has history
+_STRICT_HISTORY_GUARDRAIL = """STRICT RESPONSE CONSTRAINTS:
+- ALWAYS use lookup_scenarios to find the appropriate query for the user's request
+- EXECUTE the exact query from instructions.md - do not skip query execution
+- Do NOT create analysis, fact sheets, or speculation - execute queries and return table results
+- Only report data that comes from successful query results
+- If a query fails, report the error and ask for guidance
+- Use lookup_context to get stored values for placeholders in queries"""
+
+# Strict-mode preamble for a first chat turn (no history); the user message follows it
+_STRICT_NO_HISTORY_PREFIX = (
+    "STRICT RESPONSE MODE:\n"
+    "- ALWAYS start by calling lookup_scenarios with the user's request\n"
+    "- EXECUTE the queries returned by lookup_scenarios - do not skip execution\n"
+    "- Use lookup_context to get stored values if queries have placeholders\n"
+    "- Only return factual data from query results, no speculation\n\n"
 )
 
+# execute_query arguments that mcp_tool_func derives itself rather than passing through
+_EQ_RESERVED = frozenset({"clusterUrl", "database", "query"})
+
+# Structural characters for the JSON span scanner; everything else is skipped by the C regex engine
+_JSON_TOKEN_RE = re.compile(r'[{}\[\]"\\]')
+# Outside any candidate only an opening bracket matters (quotes in prose are irrelevant)
+_JSON_OPEN_RE = re.compile(r'[{\[]')
+# Inside a JSON string only the closing quote and escapes are significant
+_JSON_STRING_TOKEN_RE = re.compile(r'["\\]')
+# Decodes a JSON value starting at an arbitrary offset of a larger string
+_JSON_DECODER = json.JSONDecoder()
+# Give up on an unterminated JSON candidate after this many characters
+_JSON_MAX_SPAN = 200_000
+# A payload that can only decode to a JSON object (optional leading whitespace, then "{")
+_LEADING_JSON_OBJECT_RE = re.compile(r'\s*\{')
+
+# Bold markdown table titles such as "**Device Details Table**"
+_TABLE_HEADER_RE = re.compile(r'\*\*[^*]*Table\*\*\s*', re.IGNORECASE)
+# Summary cleanup: runs of 3+ newlines, and bullet markers left empty after stripping
+_MULTI_NL_RE = re.compile(r'\n{3,}')
+_EMPTY_BULLET_RE = re.compile(r'\n\s*[-*]\s*\n')
+# Speculative wording for strict mode; plain substrings (no word boundaries) so
+# "unlikely" or "impossible" still match as they did with the old `in` checks
+_SPECULATIVE_RE = re.compile(r'likely|probably|possible|might|inferred|it is probable', re.IGNORECASE)
+# Fenced mermaid block in a final response
+_MERMAID_RE = re.compile(r"```mermaid\s+([\s\S]*?)```", re.IGNORECASE)
+# Unfenced "timeline" fallback; avoids lowercasing the whole response to look for it
+_TIMELINE_RE = re.compile(r"timeline", re.IGNORECASE)
+
+# Device/object GUIDs mentioned in a free-text chat message
+_GUID_RE = re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b")
+
+# Fallback intent keywords, in priority order
+_FALLBACK_INTENT_KEYWORDS: dict[str, tuple[str, ...]] = {
+    "device_details": ("device", "details", "information", "info", "properties"),
+    "compliance": ("compliance", "compliant", "policy", "complies"),
+    "applications": ("app", "application", "software", "install"),
+    "user_lookup": ("user", "owner", "who"),
+    "tenant_info": ("tenant", "organization", "company"),
+    "effective_groups": ("group", "membership", "assigned"),
+    "mam_policy": ("mam", "mobile", "management"),
+}
+# One named lookahead per intent, tried in order at the start of the lowercased message,
+# so the first intent with any keyword anywhere in the text wins (plain substring match)
+_FALLBACK_INTENT_RE = re.compile(
+    "|".join(
+        f"(?P<{intent}>(?=.*?(?:{'|'.join(map(re.escape, keywords))})))"
+        for intent, keywords in _FALLBACK_INTENT_KEYWORDS.items()
+    ),
+    re.DOTALL,
+)
 
+# Extracts the cluster/database pair from a Kusto query, used for MCP session prewarm
+_CLUSTER_DB_RE = re.compile(r"cluster\([\"']([^\"']+)[\"']\)\.database\([\"']([^\"']+)[\"']\)")
+# execute_query target extraction: cluster("url") with or without scheme,
+# base_query('url', ...) function calls, and .database("db")
+_KQL_CLUSTER_RE = re.compile(r"cluster\(['\"](?:https?://)?([^'\"]+)['\"]\)")
+_KQL_BASE_QUERY_RE = re.compile(r"base_query\(['\"]([^'\"]+)['\"]")
+_KQL_DATABASE_RE = re.compile(r"\.database\(['\"]([^'\"]+)['\"]\)")
 
-def _normalize_datetime_value(raw: Any) -> Any:
-    """Convert common ISO 8601 datetime strings to Kusto friendly format."""
-    from datetime import datetime as dt_parser
+# Define the Union type for Magentic callback events
+MagenticCallbackEvent: TypeAlias = (
+    "MagenticOrchestratorMessageEvent"
+    " | MagenticAgentDeltaEvent"
+    " | MagenticAgentMessageEvent"
+    " | MagenticFinalResultEvent"
+)
 
-    if not isinstance(raw, str):
-        return raw
-    if 'T' not in raw and ':' in raw:
+# Deferred Agent Framework names, resolved on first attribute access (PEP 562)
+_LAZY_IMPORTS: dict[str, str] = {
+    "ChatAgent": "agent_framework",
+    "MagenticAgentDeltaEvent": "agent_framework",
+    "MagenticAgentMessageEvent": "agent_framework",
+    "MagenticBuilder": "agent_framework",
+    "MagenticFinalResultEvent": "agent_framework",
+    "MagenticOrchestratorMessageEvent": "agent_framework",
+    "WorkflowOutputEvent": "agent_framework",
+    "AzureOpenAIChatClient": "agent_framework.azure",
+}
+
+
+def __getattr__(name: str) -> Any:
+    module_name = _LAZY_IMPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
+
+
+
+# Canonical ISO 8601 shapes the Instructions MCP placeholders usually carry; the
+# date and time groups are already in Kusto order, so no strptime round-trip is needed
+_ISO_DATETIME_RE = re.compile(
+    r"([1-9]\d{3}-\d{2}-\d{2})T(\d{2}:\d{2}:\d{2})(?:Z|\+00:00|\.\d{1,6}(?:Z|\+00:00))?",
+    re.ASCII,
+)
+# Every strptime format below starts with a four-digit year, so nothing else can parse
+_ISO_YEAR_PREFIX_RE = re.compile(r"\d{4}-")
+# strptime formats keyed by (UTC suffix, has fractional seconds); the suffix alone
+# decides which format can possibly match, so at most one is ever tried
+_ISO_DATETIME_FORMATS: dict[tuple[str, bool], str] = {
+    ('Z', True): '%Y-%m-%dT%H:%M:%S.%fZ',
+    ('Z', False): '%Y-%m-%dT%H:%M:%SZ',
+    ('', False): '%Y-%m-%dT%H:%M:%S',
+    ('+00:00', True): '%Y-%m-%dT%H:%M:%S.%f+00:00',
+    ('+00:00', False): '%Y-%m-%dT%H:%M:%S+00:00',
+}
+
+
+@functools.lru_cache(maxsize=4096)
+def _normalize_iso_datetime(raw: str) -> str:
+    """Kusto-format a datetime string (memoized; the same time windows recur across queries)"""
+    match = _ISO_DATETIME_RE.fullmatch(raw)
+    if match:
+        date_part, time_part = match.groups()
+        try:
+            datetime.fromisoformat(f"{date_part}T{time_part}")
+        except ValueError:
+            return raw
+        return f"{date_part} {time_part}"
+    if not _ISO_YEAR_PREFIX_RE.match(raw):
         return raw
-    iso_candidates = [
-        '%Y-%m-%dT%H:%M:%S.%fZ',
-        '%Y-%m-%dT%H:%M:%SZ',
-        '%Y-%m-%dT%H:%M:%S',
-        '%Y-%m-%dT%H:%M:%S.%f+00:00',
-        '%Y-%m-%dT%H:%M:%S+00:00'
-    ]
-    for fmt in iso_candidates:
+    # Non-canonical spellings (single-digit fields, lowercase 't', repeated 'Z', years before
+    # 1000 that strftime prints unpadded) keep strptime's rules
+    if raw.endswith('+00:00'):
+        suffix = '+00:00'
+    elif raw[-1] in 'Zz':  # strptime matches format literals case-insensitively
+        suffix = 'Z'
+    else:
+        suffix = ''
+    fmt = _ISO_DATETIME_FORMATS.get((suffix, '.' in raw))
+    if fmt is not None:
         try:
-            return dt_parser.strptime(raw, fmt).strftime('%Y-%m-%d %H:%M:%S')
+            return datetime.strptime(raw, fmt).strftime('%Y-%m-%d %H:%M:%S')
         except ValueError:
-            continue
-    if raw.endswith('Z'):
+            pass
+    # A single trailing 'Z' was covered by the Z formats above; only repeated ones can still parse
+    if raw.endswith('ZZ'):
         try:
             trimmed = raw.rstrip('Z')
-            return dt_parser.strptime(trimmed, '%Y-%m-%dT%H:%M:%S').strftime('%Y-%m-%d %H:%M:%S')
+            return datetime.strptime(trimmed, '%Y-%m-%dT%H:%M:%S').strftime('%Y-%m-%d %H:%M:%S')
         except ValueError:
             return raw
     return raw
 
 
+def _normalize_datetime_value(raw: Any) -> Any:
+    """Convert common ISO 8601 datetime strings to Kusto friendly format."""
+    if not isinstance(raw, str):
+        return raw
+    # Every parseable value starts with a year digit; anything else skips the cache entirely
+    if not raw[:1].isdigit() or ('T' not in raw and ':' in raw):
+        return raw
+    return _normalize_iso_datetime(raw)
+
+
+@functools.lru_cache(maxsize=256)
+def _is_time_placeholder(key_name: str) -> bool:
+    """Whether a placeholder holds a datetime (memoized; the same few key names recur)"""
+    return key_name.lower().endswith('time')
+
+
 def _normalize_placeholder_value(key_name: str, raw: Any) -> Any:
     """Apply post-processing to match Instructions MCP expectations."""
+    # Plain strings (GUIDs, names) are the common case; only time keys need parsing
+    if isinstance(raw, str):
+        return _normalize_datetime_value(raw) if _is_time_placeholder(key_name) else raw
     if raw is None:
         return raw
     if isinstance(raw, list):
         return ','.join(str(item) for item in raw)
     if isinstance(raw, (int, float)):
         return str(raw)
-    if isinstance(raw, str) and key_name.lower().endswith('time'):
-        return _normalize_datetime_value(raw)
     return raw
 
 
-def create_context_lookup_function() -> Callable[..., Awaitable[str]]:
-    """Create a function for looking up stored conversation context"""
+@functools.lru_cache(maxsize=512)
+def _format_list_placeholder(raw: str) -> str:
+    """Reformat a comma-separated ID list as quoted KQL values (memoized; lists are reused across tools)"""
+    # Remove any existing quotes and spaces, then reformat
+    clean_values = [v.strip().strip("'\"") for v in raw.split(',')]
+    return ', '.join(f"'{v}'" for v in clean_values if v)
+
+
+def create_context_lookup_function(context_service: Any) -> Callable[..., Awaitable[str]]:
+    """Create a function for looking up stored conversation context
+    
+    The conversation state service is a process-wide singleton, so it is bound once here.
+    """
     
     async def lookup_context(key: str = "") -> str:
         """Look up stored conversation context values like DeviceId, AccountId, ContextId from previous queries.
@@ -110,10 +329,6 @@ def create_context_lookup_function() -> Callable[..., Awaitable[str]]:
             The requested context value(s) or information about available context
         """
         try:
-            from services.conversation_state import get_conversation_state_service
-            
-            context_service = get_conversation_state_service()
-            
             logger.info(f"[AgentFramework] Context lookup called with key: '{key}'")
             
             if key:
@@ -130,9 +345,13 @@ def create_context_lookup_function() -> Callable[..., Awaitable[str]]:
                 # Return all available context
                 all_context = context_service.get_all_context()
                 if all_context:
-                    context_lines = [f"{k}: {v}" for k, v in all_context.items()]
-                    logger.info(f"[AgentFramework] Returning all context: {list(all_context.keys())}")
-                    return "Available conversation context:\n" + "\n".join(context_lines)
+                    if logger.isEnabledFor(logging.INFO):
+                        logger.info("[AgentFramework] Returning all context: %s", list(all_context.keys()))
+                    # Header and entries go through one join, so the result is built in a single copy
+                    return "\n".join(itertools.chain(
+                        ("Available conversation context:",),
+                        (f"{k}: {v}" for k, v in all_context.items()),
+                    ))
                 else:
                     logger.info("[AgentFramework] No conversation context available")
                     return "No conversation context available."
@@ -146,12 +365,82 @@ def create_context_lookup_function() -> Callable[..., Awaitable[str]]:
     
     return lookup_context
 
-def create_mcp_tool_function(tool_name: str, tool_description: str) -> Callable[..., Awaitable[str]]:
+@functools.lru_cache(maxsize=32)
+def _normalize_cluster_url(cluster_url: str) -> str:
+    """Ensure a Kusto cluster URL carries the https:// scheme (memoized; few distinct clusters)"""
+    if cluster_url.startswith("https://"):
+        return cluster_url
+    return f"https://{cluster_url}"
+
+@functools.lru_cache(maxsize=512)
+def _extract_cluster_db(query: str) -> tuple[str | None, str | None]:
+    """Pull the target cluster URL and database out of a KQL query (memoized; scenario reruns repeat queries)"""
+    cluster_url = None
+    database = None
+    
+    # Pattern 1: Direct cluster calls - cluster("url").database("db") or cluster('url').database('db')
+    # Handles both single and double quotes, with or without https:// prefix
+    direct_cluster_match = _KQL_CLUSTER_RE.search(query)
+    if direct_cluster_match:
+        cluster_url = direct_cluster_match.group(1)
+    
+    # Pattern 2: base_query function calls - base_query('url', 'label')
+    # This pattern is used when queries define a function parameter
+    if not cluster_url or cluster_url == "cluster":
+        base_query_match = _KQL_BASE_QUERY_RE.search(query)
+        if base_query_match:
+            cluster_url = base_query_match.group(1)
+    
+    # Extract database name
+    database_match = _KQL_DATABASE_RE.search(query)
+    if database_match:
+        database = database_match.group(1)
+    
+    return cluster_url, database
+
+def _post_process(normalized: NormalizedResult, context_service: Any) -> None:
+    """Record a successful normalized MCP result in conversation context and the table buffer"""
+    if not normalized.get("success"):
+        return
+    context_service.update_from_query_result(normalized)
+    if isinstance(normalized.get("table"), dict):
+        _tool_results_buffer().append(normalized)
+
+# Serializes Kusto MCP reconnects so concurrent failing tool calls tear down the session once
+_KUSTO_RECONNECT_LOCK = asyncio.Lock()
+
+async def _reconnect_kusto_session(failed_session: Any) -> tuple[Any, Any]:
+    """Return the live Kusto service and session, reconnecting if the failed session is still current"""
+    from services.kusto_mcp_service import get_kusto_service
+
+    async with _KUSTO_RECONNECT_LOCK:
+        kusto_service = await get_kusto_service()
+        if kusto_service._session is None or kusto_service._session is failed_session:
+            logger.warning("[AgentFramework] Kusto MCP session failed; reconnecting")
+            await kusto_service.cleanup()
+            await kusto_service.initialize()
+        if kusto_service._session is None:
+            raise RuntimeError("Kusto MCP session not available after reconnect")
+        return kusto_service, kusto_service._session
+
+def create_mcp_tool_function(
+    tool_name: str,
+    tool_description: str,
+    kusto_service: Any,
+    context_service: Any,
+    session: Any,
+) -> Callable[..., Awaitable[str]]:
     """Create an async function wrapper for an MCP tool
     
     This maintains compatibility with the Autogen implementation's MCP tool pattern,
     including the same parameter handling and context substitution logic.
+    The Kusto and conversation state services are singletons, so they are bound
+    once here instead of being resolved on every call. The MCP session is captured
+    at discovery time; when a call on it fails, the Kusto service is re-resolved via
+    get_kusto_service(), reconnected if needed, and the call is retried once.
     """
+    # The tool never changes for this closure, so decide the query-rewriting path once
+    is_execute_query = tool_name == "execute_query"
     
     async def mcp_tool_func(**kwargs: Any) -> str:
         """Execute MCP tool.
@@ -162,13 +451,8 @@ def create_mcp_tool_function(tool_name: str, tool_description: str) -> Callable[
         Returns:
             Result from the MCP tool execution
         """
+        nonlocal kusto_service, session
         try:
-            from services.conversation_state import get_conversation_state_service
-            from services.kusto_mcp_service import get_kusto_service
-            
-            kusto_service = await get_kusto_service()
-            context_service = get_conversation_state_service()
-            
             # Handle nested kwargs structure from agent calls
             if "kwargs" in kwargs and isinstance(kwargs["kwargs"], dict):
                 # Agent passed arguments nested under 'kwargs'
@@ -179,42 +463,22 @@ def create_mcp_tool_function(tool_name: str, tool_description: str) -> Callable[
             
             logger.info(f"[AgentFramework] Calling MCP tool '{tool_name}' with args: {actual_args}")
             
-            # For execute_query tool, ensure proper clusterUrl format and call MCP server directly
-            if tool_name == "execute_query" and hasattr(kusto_service, '_session') and kusto_service._session:
+            # For execute_query tool, ensure proper clusterUrl format; other tools pass args through
+            if is_execute_query:
                 query = actual_args.get("query")
                 
                 if not query:
-                    return json.dumps({"success": False, "error": "Missing required parameter: query"})
+                    return _dumps({"success": False, "error": "Missing required parameter: query"})
                 
                 # Substitute placeholders in query with stored context
                 query = context_service.substitute_placeholders(query)
                 
-                logger.info(f"[AgentFramework] Query length: {len(query)} characters")
-                logger.info(f"[AgentFramework] Query (first 500 chars): {query[:500]}...")
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info("[AgentFramework] Query length: %d characters", len(query))
+                    logger.info("[AgentFramework] Query (first 500 chars): %s...", query[:500])
                 
                 # Extract cluster URL and database from the query
-                import re
-                
-                cluster_url = None
-                database = None
-                
-                # Pattern 1: Direct cluster calls - cluster("url").database("db") or cluster('url').database('db')
-                # Handles both single and double quotes, with or without https:// prefix
-                direct_cluster_match = re.search(r"cluster\(['\"](?:https?://)?([^'\"]+)['\"]\)", query)
-                if direct_cluster_match:
-                    cluster_url = direct_cluster_match.group(1)
-                
-                # Pattern 2: base_query function calls - base_query('url', 'label')
-                # This pattern is used when queries define a function parameter
-                if not cluster_url or cluster_url == "cluster":
-                    base_query_match = re.search(r"base_query\(['\"]([^'\"]+)['\"]", query)
-                    if base_query_match:
-                        cluster_url = base_query_match.group(1)
-                
-                # Extract database name
-                database_match = re.search(r"\.database\(['\"]([^'\"]+)['\"]\)", query)
-                if database_match:
-                    database = database_match.group(1)
+                cluster_url, database = _extract_cluster_db(query)
                 
                 # Use fallback defaults if not found
                 if not cluster_url or cluster_url == "cluster":
@@ -226,61 +490,45 @@ def create_mcp_tool_function(tool_name: str, tool_description: str) -> Callable[
                     logger.warning(f"[AgentFramework] Could not extract database, using default: {database}")
                 
                 # Ensure cluster URL is properly formatted (add https:// if missing)
-                if not cluster_url.startswith("https://"):
-                    cluster_url = f"https://{cluster_url}"
+                cluster_url = _normalize_cluster_url(cluster_url)
                 
-                logger.info(f"[AgentFramework] Extracted cluster URL: {cluster_url}")
-                logger.info(f"[AgentFramework] Extracted database: {database}")
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info("[AgentFramework] Extracted cluster URL: %s", cluster_url)
+                    logger.info("[AgentFramework] Extracted database: %s", database)
                 
                 mcp_args = {
                     "clusterUrl": cluster_url,
                     "database": database,
                     "query": query,
-                    **{k: v for k, v in actual_args.items() if k not in ["clusterUrl", "database", "query"]}
+                    **{k: v for k, v in actual_args.items() if k not in _EQ_RESERVED}
                 }
-                
-                try:
-                    result = await kusto_service._session.call_tool(tool_name, mcp_args)
-                    normalized = kusto_service._normalize_tool_result(result)
-                except Exception as e:
-                    logger.error(f"[AgentFramework] MCP call_tool failed: {type(e).__name__}: {e}")
-                    logger.error(f"[AgentFramework] Tool: {tool_name}")
-                    logger.error(f"[AgentFramework] Query contained {len(query)} chars")
-                    raise
-                
-                # Store query results in conversation context
-                if normalized and isinstance(normalized, dict) and normalized.get("success"):
-                    context_service.update_from_query_result(normalized)
-                    try:
-                        if isinstance(normalized.get("table"), dict):
-                            TOOL_RESULTS_BUFFER.append(normalized)
-                    except Exception:  # noqa: BLE001
-                        pass
-                
-                return json.dumps(normalized)
+            else:
+                mcp_args = actual_args
             
-            # For other tools, call MCP session directly
-            elif hasattr(kusto_service, '_session') and kusto_service._session:
-                result = await kusto_service._session.call_tool(tool_name, actual_args)
-                # Normalize the result
+            try:
+                try:
+                    result = await session.call_tool(tool_name, mcp_args)
+                except Exception:
+                    # Session may be dead or already replaced: re-resolve the service, reconnect
+                    # it if still on the failed session, and retry once on the live one
+                    kusto_service, session = await _reconnect_kusto_session(session)
+                    result = await session.call_tool(tool_name, mcp_args)
                 normalized = kusto_service._normalize_tool_result(result)
-                
-                # Store query results in conversation context if successful
-                if normalized and isinstance(normalized, dict) and normalized.get("success"):
-                    context_service.update_from_query_result(normalized)
-                    try:
-                        if isinstance(normalized.get("table"), dict):
-                            TOOL_RESULTS_BUFFER.append(normalized)
-                    except Exception:  # noqa: BLE001
-                        pass
-                
-                return json.dumps(normalized)
-            else:
-                return json.dumps({"success": False, "error": "MCP session not available"})
+            except Exception as e:
+                logger.error(f"[AgentFramework] MCP call_tool failed: {type(e).__name__}: {e}")
+                logger.error(f"[AgentFramework] Tool: {tool_name}")
+                if isinstance(mcp_args.get("query"), str):
+                    logger.error(f"[AgentFramework] Query contained {len(mcp_args['query'])} chars")
+                raise
+            
+            # Store query results in conversation context if successful
+            _post_process(normalized, context_service)
+            
+            return _dumps(normalized)
                 
         except Exception as e:
             logger.error(f"MCP tool {tool_name} execution failed: {e}")
-            return json.dumps({"success": False, "error": str(e)})
+            return _dumps({"success": False, "error": str(e)})
     
     # Set function metadata for proper tool registration
     mcp_tool_func.__name__ = tool_name
@@ -289,12 +537,20 @@ def create_mcp_tool_function(tool_name: str, tool_description: str) -> Callable[
     return mcp_tool_func
 
 
+# Fixed tool responses, serialized once
+_NO_CONTENT_RESPONSE = json.dumps({"content": "No content returned"})
+_INSTRUCTIONS_UNAVAILABLE_RESPONSE = json.dumps({"success": False, "error": "Instructions MCP session not available"})
+_DATAWAREHOUSE_UNAVAILABLE_RESPONSE = json.dumps({"success": False, "error": "Data Warehouse MCP session not available"})
+
+
 def create_instructions_mcp_tool_function(tool_name: str, tool_description: str) -> Callable[..., Awaitable[str]]:
     """Create an async function wrapper for an Instructions MCP tool
     
     Similar to create_mcp_tool_function but for the Instructions MCP server.
     These tools provide structured access to diagnostic scenarios and queries.
+    The service getter is resolved once here; it still (re)initializes the service on demand.
     """
+    from services.instructions_mcp_service import get_instructions_service
     
     async def instructions_mcp_tool_func(**kwargs: Any) -> str:
         """Execute Instructions MCP tool.
@@ -306,8 +562,6 @@ def create_instructions_mcp_tool_function(tool_name: str, tool_description: str)
             Result from the Instructions MCP tool execution
         """
         try:
-            from services.instructions_mcp_service import get_instructions_service
-            
             instructions_service = await get_instructions_service()
             
             # Handle nested kwargs structure from agent calls
@@ -318,27 +572,25 @@ def create_instructions_mcp_tool_function(tool_name: str, tool_description: str)
             
             logger.info(f"[AgentFramework] Calling Instructions MCP tool '{tool_name}' with args: {actual_args}")
             
-            if hasattr(instructions_service, '_session') and instructions_service._session:
+            session = instructions_service._session
+            if session:
                 # Normalize placeholder values to formats expected by Instructions MCP
                 if isinstance(actual_args, dict) and 'placeholder_values' in actual_args:
                     placeholder_values = actual_args['placeholder_values']
                     if isinstance(placeholder_values, dict):
-                        normalized: dict[str, Any] = {}
-                        for key, val in placeholder_values.items():
-                            # Special handling for list placeholders (PolicyIdList, GroupIdList, etc.)
-                            # Convert comma-separated GUIDs to quoted KQL format
-                            if key.endswith('List') and isinstance(val, str) and ',' in val:
-                                # Remove any existing quotes and spaces, then reformat
-                                clean_values = [v.strip().strip("'\"") for v in val.split(',')]
-                                formatted_val = ', '.join(f"'{v}'" for v in clean_values if v)
-                                normalized[key] = formatted_val
-                                logger.debug(f"[AgentFramework] Formatted {key} for KQL: {formatted_val[:100]}...")
-                            else:
-                                normalized[key] = _normalize_placeholder_value(key, val)
-                        actual_args = {**actual_args, 'placeholder_values': normalized}
-                        logger.debug(f"[AgentFramework] Normalized placeholder values for {tool_name}: {normalized}")
-
-                result = await instructions_service._session.call_tool(tool_name, actual_args)
+                        # List placeholders (PolicyIdList, GroupIdList, etc.) holding comma-separated
+                        # GUIDs are converted to quoted KQL format
+                        normalized = {
+                            key: _format_list_placeholder(val)
+                            if key.endswith('List') and isinstance(val, str) and ',' in val
+                            else _normalize_placeholder_value(key, val)
+                            for key, val in placeholder_values.items()
+                        }
+                        # actual_args is this call's own argument dict, so update it in place
+                        actual_args['placeholder_values'] = normalized
+                        logger.debug("[AgentFramework] Normalized placeholder values for %s: %s", tool_name, normalized)
+
+                result = await session.call_tool(tool_name, actual_args)
                 
                 # Properly serialize the result
                 if hasattr(result, 'content'):
@@ -356,16 +608,16 @@ def create_instructions_mcp_tool_function(tool_name: str, tool_description: str)
                                 logger.info(f"[AgentFramework] Instructions MCP tool '{tool_name}' returned {len(result_text)} chars: {result_text[:500]}...")
                             return result_text
                         else:
-                            return json.dumps({"content": str(text_content)})
-                    return json.dumps({"content": "No content returned"})
+                            return _dumps({"content": str(text_content)})
+                    return _NO_CONTENT_RESPONSE
                 else:
-                    return json.dumps({"result": str(result)})
+                    return _dumps({"result": str(result)})
             else:
-                return json.dumps({"success": False, "error": "Instructions MCP session not available"})
+                return _INSTRUCTIONS_UNAVAILABLE_RESPONSE
                 
         except Exception as e:
             logger.error(f"Instructions MCP tool {tool_name} execution failed: {e}")
-            return json.dumps({"success": False, "error": str(e)})
+            return _dumps({"success": False, "error": str(e)})
     
     # Set function metadata for proper tool registration
     instructions_mcp_tool_func.__name__ = tool_name
@@ -379,7 +631,9 @@ def create_datawarehouse_mcp_tool_function(tool_name: str, tool_description: str
     
     Similar to create_mcp_tool_function but for the Data Warehouse MCP server.
     These tools provide OData-based access to Intune historical data (24-hour snapshots).
+    The service getter is resolved once here rather than imported on every call.
     """
+    from services.datawarehouse_mcp_service import get_datawarehouse_service
     
     async def datawarehouse_mcp_tool_func(**kwargs: Any) -> str:
         """Execute Data Warehouse MCP tool.
@@ -391,8 +645,6 @@ def create_datawarehouse_mcp_tool_function(tool_name: str, tool_description: str
             Result from the Data Warehouse MCP tool execution in table-compatible format
         """
         try:
-            from services.datawarehouse_mcp_service import get_datawarehouse_service
-            
             datawarehouse_service = await get_datawarehouse_service()
             
             # Handle nested kwargs structure from agent calls
@@ -403,8 +655,9 @@ def create_datawarehouse_mcp_tool_function(tool_name: str, tool_description: str
             
             logger.info(f"[AgentFramework] Calling Data Warehouse MCP tool '{tool_name}' with args: {actual_args}")
             
-            if hasattr(datawarehouse_service, '_session') and datawarehouse_service._session:
-                result = await datawarehouse_service._session.call_tool(tool_name, actual_args)
+            session = datawarehouse_service._session
+            if session:
+                result = await session.call_tool(tool_name, actual_args)
                 
                 # Properly serialize the result
                 if hasattr(result, 'content'):
@@ -435,7 +688,7 @@ def create_datawarehouse_mcp_tool_function(tool_name: str, tool_description: str
                                             "data": parsed["value"],  # List of records for table rendering
                                             "total_count": len(parsed["value"])
                                         }
-                                        return json.dumps(table_result, indent=2)
+                                        return _dumps(table_result)
                                     # Check if it's already a success wrapper
                                     elif "success" in parsed and "data" in parsed:
                                         # Unwrap nested data if it has OData format
@@ -448,22 +701,22 @@ def create_datawarehouse_mcp_tool_function(tool_name: str, tool_description: str
                                                 "data": data["value"],
                                                 "total_count": len(data["value"])
                                             }
-                                            return json.dumps(table_result, indent=2)
+                                            return _dumps(table_result)
                             except json.JSONDecodeError:
                                 pass  # Return original text if not valid JSON
                             
                             return result_text
                         else:
-                            return json.dumps({"content": str(text_content)})
-                    return json.dumps({"content": "No content returned"})
+                            return _dumps({"content": str(text_content)})
+                    return _NO_CONTENT_RESPONSE
                 else:
-                    return json.dumps({"result": str(result)})
+                    return _dumps({"result": str(result)})
             else:
-                return json.dumps({"success": False, "error": "Data Warehouse MCP session not available"})
+                return _DATAWAREHOUSE_UNAVAILABLE_RESPONSE
                 
         except Exception as e:
             logger.error(f"Data Warehouse MCP tool {tool_name} execution failed: {e}")
-            return json.dumps({"success": False, "error": str(e)})
+            return _dumps({"success": False, "error": str(e)})
     
     # Set function metadata for proper tool registration
     datawarehouse_mcp_tool_func.__name__ = tool_name
@@ -472,6 +725,403 @@ def create_datawarehouse_mcp_tool_function(tool_name: str, tool_description: str
     return datawarehouse_mcp_tool_func
 
 
+def _match_json_span(text: str, start: int) -> tuple[int, bool]:
+    """Match the JSON object/array whose opening bracket is at text[start].
+    
+    Returns (end, True) when the brackets balance at text[end - 1], or (resume, False)
+    when the candidate is abandoned; the search for the next candidate resumes there.
+    Only structural characters are visited; the text between them is skipped by the
+    regex scanner. Inside a JSON string only quotes and backslashes matter, so string
+    bodies (which may be full of brackets) are skipped in one search as well.
+    
+    The character-class search runs in C, which already gives the skip-boring-bytes
+    effect; pure-Python word-at-a-time (SWAR) scanning was measured ~35x slower.
+    """
+    depth = 1
+    in_string = False
+    # Unterminated candidates are abandoned once they run past the span limit; the
+    # searches are bounded there too so they never scan text beyond it
+    limit = start + _JSON_MAX_SPAN + 1
+    endpos = limit + 1
+    pos = start + 1
+    while True:
+        m = (_JSON_STRING_TOKEN_RE if in_string else _JSON_TOKEN_RE).search(text, pos, endpos)
+        if m is None:
+            return min(endpos, len(text)), False
+        i = m.start()
+        ch = text[i]
+        pos = i + 1
+        if in_string:
+            if ch == '\\':
+                pos = i + 2  # skip the escaped character
+            else:
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in '{[':
+            depth += 1
+        elif ch in '}]':
+            depth -= 1
+            if depth == 0:
+                return i + 1, True
+        if i == limit:
+            return i + 1, False
+
+
+def _find_json_ranges(text: str) -> list[tuple[int, int]]:
+    """Return (start, end) spans of balanced JSON objects/arrays embedded in text."""
+    ranges: list[tuple[int, int]] = []
+    pos = 0
+    while (m := _JSON_OPEN_RE.search(text, pos)) is not None:
+        start = m.start()
+        pos, closed = _match_json_span(text, start)
+        if closed:
+            ranges.append((start, pos))
+    return ranges
+
+
+def _scan_json(text: str) -> tuple[list[Any], list[tuple[int, int]]]:
+    """Decode embedded JSON values and collect balanced spans in a single pass.
+
+    The spans are exactly those `_find_json_ranges` would return for the same text,
+    so callers that need both the objects and the excision ranges scan only once.
+    """
+    results: list[Any] = []
+    ranges: list[tuple[int, int]] = []
+    # The first opener search doubles as the "any JSON here?" check
+    pos = 0
+    while (m := _JSON_OPEN_RE.search(text, pos)) is not None:
+        start = m.start()
+        # Well-formed candidates are decoded in place, without a separate bracket scan
+        try:
+            obj, end = _JSON_DECODER.raw_decode(text, start)
+        except (ValueError, RecursionError):
+            end = -1
+        if start < end <= start + _JSON_MAX_SPAN + 2:
+            results.append(obj)
+            ranges.append((start, end))
+            pos = end
+            continue
+        # Malformed or oversized: skip the candidate exactly as the span scanner would
+        pos, closed = _match_json_span(text, start)
+        if closed:
+            ranges.append((start, pos))
+    return results, ranges
+
+
+def _strip_ranges(text: str, ranges: Sequence[tuple[int, int]]) -> str:
+    """Return text with the given sorted, non-overlapping (start, end) spans removed."""
+    if not ranges:
+        return text
+    # One gap before each span plus the tail; presized so the list never regrows
+    # (empty gaps slice to the shared '' singleton, so no per-gap allocation)
+    cleaned_parts: list[str] = [''] * (len(ranges) + 1)
+    last_end = 0
+    for i, (start, end) in enumerate(ranges):
+        cleaned_parts[i] = text[last_end:start]
+        last_end = end
+    cleaned_parts[-1] = text[last_end:]
+    return ''.join(cleaned_parts)
+
+
+@functools.lru_cache(maxsize=None)
+def _magentic_event_classes() -> tuple[type, type, type, type]:
+    """Resolve the Magentic event classes once (agent_framework is imported lazily).
+
+    Returns (orchestrator message, agent delta, agent message, final result) classes.
+    """
+    from agent_framework import (
+        MagenticAgentDeltaEvent,
+        MagenticAgentMessageEvent,
+        MagenticFinalResultEvent,
+        MagenticOrchestratorMessageEvent,
+    )
+    return (
+        MagenticOrchestratorMessageEvent,
+        MagenticAgentDeltaEvent,
+        MagenticAgentMessageEvent,
+        MagenticFinalResultEvent,
+    )
+
+@functools.lru_cache(maxsize=None)
+def _function_result_content_class() -> type:
+    """Resolve FunctionResultContent once; its module path differs across agent_framework versions."""
+    try:
+        from agent_framework._types import FunctionResultContent
+    except ImportError:
+        from agent_framework import FunctionResultContent
+    return FunctionResultContent
+
+# event.message.text as one C-level attribute chain (Magentic events wrap a ChatMessage)
+_get_event_message_text = operator.attrgetter('message.text')
+
+
+def _event_message_text(event: Any) -> str | None:
+    """Text of a Magentic event's message; None when the event carries no message."""
+    try:
+        return _get_event_message_text(event) or ''
+    except AttributeError:
+        return None
+
+
+def _text_parts(items: Any) -> str:
+    """Join the text of message/content items (or plain strings), skipping anything else"""
+    parts: list[str] = []
+    for item in items:
+        if isinstance(item, str):
+            text = item
+        else:
+            text = getattr(item, 'text', None)
+        if text:
+            parts.append(text if isinstance(text, str) else str(text))
+    return " ".join(parts)
+
+
+def _workflow_output_text(data: Any) -> str:
+    """Extract the response text from a WorkflowOutputEvent payload.
+
+    Only text-bearing attributes are read. Container payloads are walked for their
+    items' text instead of being stringified, since str() of a message list or an
+    object with embedded tool results can run to megabytes that are discarded anyway.
+    """
+    try:
+        if data is None:
+            return ""
+        if isinstance(data, str):
+            return data
+        text = getattr(data, 'text', None)
+        if text:
+            return text
+        content = getattr(data, 'content', None)
+        if content:
+            return str(content)
+        contents = getattr(data, 'contents', None)
+        if contents:
+            return _text_parts(contents)
+        if isinstance(data, (list, tuple)):
+            return _text_parts(data)
+        return str(data)
+    except Exception as extract_err:  # noqa: BLE001
+        logger.warning("Failed to extract text from workflow output (%s): %s", type(data).__name__, extract_err)
+        return ""
+
+def _summarize_history(turns: list[dict[str, str]]) -> str:
+    """Condense older chat turns into one short context note, without a model call.
+
+    Keeps what later turns typically refer back to: the user's requests (first line,
+    trimmed) and every GUID mentioned by either side, in first-seen order.
+    """
+    requests: list[str] = []
+    identifiers: dict[str, None] = {}
+    for turn in turns:
+        content = turn["content"]
+        for match in _GUID_RE.finditer(content):
+            identifiers.setdefault(match.group(0).lower())
+        if turn["role"] == "user":
+            first_line = content.strip().split('\n', 1)[0]
+            if first_line:
+                requests.append(first_line[:160])
+    lines = [f"Summary of {len(turns)} earlier conversation turn(s):"]
+    if requests:
+        lines.append("User asked about:")
+        lines.extend(f"- {request}" for request in requests)
+    if identifiers:
+        lines.append("Identifiers referenced: " + ", ".join(identifiers))
+    return "\n".join(lines)
+
+# Responses repeat (templated strict-mode replies, help text), and both filters below are
+# pure functions of their inputs, so recent results are memoized. Keys hold the full text;
+# a hit costs one hash plus one compare instead of a rescan.
+_SUMMARY_CACHE_SIZE = 32
+
+
+@functools.lru_cache(maxsize=_SUMMARY_CACHE_SIZE)
+def _filter_speculation(text: str, has_data: bool) -> str:
+    """Strict-mode speculation filter body for AgentFrameworkService._apply_speculation_filter."""
+    lines = text.split('\n')
+    cleaned: list[str] = []
+    for line in lines:
+        if _SPECULATIVE_RE.search(line):
+            if not has_data:
+                continue
+            else:
+                line += "  (Speculative wording trimmed under strict mode; verify with actual query results.)"
+        cleaned.append(line)
+    result = '\n'.join(cleaned).strip()
+    if not result:
+        return "(Strict mode removed speculative content; no factual data returned.)"
+    return result
+
+
+@functools.lru_cache(maxsize=_SUMMARY_CACHE_SIZE)
+def _clean_summary_text(text: str, json_ranges: tuple[tuple[int, int], ...] | None) -> str:
+    """Summary cleanup body for AgentFrameworkService._clean_summary_from_json."""
+    # Steps 1-2: Classify each line once, dropping markdown table rows (header, |---|
+    # separator and data rows all look like "| ... |") and bold table titles
+    # (e.g., "**Device Details Table**")
+    kept_lines: list[str] = []
+    lines_changed = False
+    for line in text.split('\n'):
+        stripped = line.strip()
+        if len(stripped) > 2 and stripped[0] == '|' and stripped[-1] == '|':
+            lines_changed = True
+            continue
+        if '**' in line:
+            titled = _TABLE_HEADER_RE.sub('', line)
+            if titled != line:
+                lines_changed = True
+                line = titled
+                if not line.strip():
+                    continue  # the line held only a table title
+        kept_lines.append(line)
+    cleaned = '\n'.join(kept_lines) if lines_changed else text
+    
+    # Step 3: Remove JSON objects
+    spans = json_ranges if json_ranges is not None and not lines_changed else _find_json_ranges(cleaned)
+    cleaned = _strip_ranges(cleaned, spans)
+    
+    # Step 4: Clean up formatting
+    # Remove multiple consecutive newlines
+    cleaned = _MULTI_NL_RE.sub('\n\n', cleaned)
+    
+    # Remove leading/trailing whitespace
+    cleaned = cleaned.strip()
+    
+    # Remove empty bullet points or list markers that might be left over
+    cleaned = _EMPTY_BULLET_RE.sub('\n', cleaned)
+    
+    return cleaned
+
+
+# Tables with more rows than this are signed by their first/last rows plus row count
+_TABLE_SIG_EDGE_ROWS = 8
+
+
+def _table_signature(table: dict[str, Any]) -> bytes:
+    """Content-aware dedup key: name, columns and row data hashed with blake2b.
+
+    Tables sharing name, schema and row count but differing in content no longer
+    collide. Large tables only hash their edge rows so signing stays O(1).
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(table.get('name') or '').encode())
+    h.update(repr(tuple(table.get('columns', []))).encode())
+    rows = table.get('rows', [])
+    h.update(len(rows).to_bytes(8, 'little'))
+    if len(rows) > 2 * _TABLE_SIG_EDGE_ROWS:
+        rows = itertools.chain(rows[:_TABLE_SIG_EDGE_ROWS], rows[-_TABLE_SIG_EDGE_ROWS:])
+    for row in rows:
+        h.update(repr(row).encode())
+    return h.digest()
+
+# SIMPLIFIED system instructions - focus on workflow, not anti-patterns
+_INTUNE_EXPERT_INSTRUCTIONS = """You are an Intune Expert assistant specializing in Microsoft Intune diagnostics.
+
+Your primary role is to execute queries to retrieve and analyze Intune device information using two data sources:
+1. Data Warehouse API - For historical baseline data (devices, users, apps, policies) updated daily
+2. Kusto queries - For real-time event data and telemetry
+
+WORKFLOW:
+1. Use search_scenarios(query) to find relevant scenarios
+2. Use get_scenario(slug) to get scenario details with steps
+3. For each step in order:
+   - If step uses Data Warehouse: Use query_entity() with appropriate filters
+   - If step uses Kusto: Use substitute_and_get_query() then execute_query()
+4. Format results as tables and provide summary
+
+DATA SOURCE SELECTION:
+- Use Data Warehouse API for:
+  * Device baseline information (deviceId, deviceName, manufacturer, model, OS version)
+  * User information (userId, userPrincipalName, displayName)
+  * App installation status
+  * Policy compliance status
+  * Historical snapshots (data refreshed daily at Midnight UTC)
+  
+- Use Kusto (execute_query) for:
+  * Real-time events and telemetry
+  * Event sequences and timelines
+  * Complex joins and aggregations
+  * Custom diagnostic queries
+
+⚠️ DATA WAREHOUSE API LIMITATIONS:
+The Data Warehouse API does NOT support $filter or $select OData parameters - both cause HTTP 400 errors.
+Instead:
+- To find a specific device: Use find_device_by_id(device_id) - NOT query_entity with filter
+- To get all devices: Use query_entity(entity="devices") without filter/select parameters
+- The API returns all 39 fields per device - you cannot select specific columns
+- Client-side filtering is the only reliable method for single-device lookups
+
+AVAILABLE TOOLS:
+Scenario Management:
+- search_scenarios: Find scenarios matching keywords
+- get_scenario: Get full scenario definition  
+- get_query: Get raw query text for a specific query_id
+- substitute_and_get_query: Get executable query with placeholders filled and validated
+
+Data Warehouse API (Historical Data):
+- list_entities: List all available Data Warehouse entities
+- get_entity_schema: Get schema/properties for an entity
+- query_entity: Query entity WITHOUT filters (⚠️ $filter and $select cause HTTP 400)
+- execute_odata_query: Execute raw OData query URL (advanced use only)
+- find_device_by_id: Find a specific device by ID (RECOMMENDED for single device lookups)
+
+Kusto (Real-time Data):
+- execute_query: Run Kusto query (use ONLY with queries from substitute_and_get_query)
+
+Context:
+- lookup_context: Get stored values from previous queries
+
+CRITICAL RULES:
+1. Execute scenarios step by step in sequential order (1, 2, 3, ...)
+2. For Kusto steps: ALWAYS call substitute_and_get_query AND execute_query - both required
+3. Getting a query with substitute_and_get_query is NOT execution - you must call execute_query next
+4. For Data Warehouse device lookups: ALWAYS use find_device_by_id(device_id) - NEVER query_entity with filter
+5. For Data Warehouse bulk queries: Use query_entity(entity) without $filter or $select parameters
+6. NEVER pass filter= or select= parameters to query_entity - they cause HTTP 400 errors
+7. Don't write your own Kusto queries - use exact queries from substitute_and_get_query
+8. substitute_and_get_query validates automatically - don't call separate validation
+9. After completing ALL steps (every execute_query call), format results and provide summary
+10. Present results as formatted markdown tables
+
+⚠️ SCENARIO COMPLETION SIGNAL (MANDATORY):
+When you have completed ALL steps in a scenario and provided the summary:
+- End your response with the exact marker: **[SCENARIO_COMPLETE]**
+- This marker MUST appear on its own line at the very end of your response
+- Do NOT add this marker until ALL steps are executed and results are formatted
+- The orchestrator uses this marker to detect completion and stop the workflow
+- Example:
+  
+  (... tables and summary here ...)
+  
+  **[SCENARIO_COMPLETE]**
+
+PLACEHOLDER HANDLING:
+- Always use PascalCase: DeviceId, StartTime, EndTime, EffectiveGroupIdList
+- Call lookup_context() if you need values from previous queries
+- Pass all placeholders to substitute_and_get_query as a dictionary
+- If substitute_and_get_query returns validation errors, fix the values and retry
+
+EXAMPLE WORKFLOW (Data Warehouse + Kusto):
+1. search_scenarios(query="device timeline") → Get slug
+2. get_scenario(slug="device-timeline") → Get steps array (returns 5 steps)
+3. Step 1 (Data Warehouse - Device Baseline):
+   - find_device_by_id(device_id="abc123") → Returns device with all 39 fields
+4. Step 2 (Kusto - Events):
+   - substitute_and_get_query(query_id="device-timeline_step2", placeholder_values={"DeviceId": "abc123"})
+   - execute_query(query="<returned query>") ← REQUIRED - don't skip this
+5. Step 3 (Kusto - Events):
+   - substitute_and_get_query(query_id="device-timeline_step3", placeholder_values={"DeviceId": "abc123"})
+   - execute_query(query="<returned query>") ← REQUIRED - don't skip this
+6. Step 4 (Kusto - Events):
+   - substitute_and_get_query(query_id="device-timeline_step4", placeholder_values={"DeviceId": "abc123"})
+   - execute_query(query="<returned query>") ← REQUIRED - don't skip this
+7. Step 5 (Kusto - Events):
+   - substitute_and_get_query(query_id="device-timeline_step5", placeholder_values={"PolicyIdList": "..."})
+   - execute_query(query="<returned query>") ← REQUIRED - don't skip this
+8. After ALL execute_query calls complete, format all results and provide summary
+"""
+
+
 class AgentFrameworkService:
     """Agent Framework implementation for Intune diagnostics
     
@@ -493,29 +1143,29 @@ class AgentFrameworkService:
         self.magentic_workflow: Any | None = None  # MagenticWorkflow instance
         self.chat_client: AzureOpenAIChatClient | None = None
         
-        # Force reload scenarios to ensure we have the latest matching logic
-        from services.scenario_lookup_service import reload_scenarios
-        reload_scenarios()
+        # Reload scenarios once per process so later instances skip re-parsing instructions.md
+        from services.scenario_lookup_service import ensure_scenarios_loaded
+        ensure_scenarios_loaded()
         self.scenario_service = get_scenario_service()
+        # Scenarios in instructions order for run_instruction_scenario index lookups; rebuilt on reload
+        self._scenario_list: list[Any] = list(self.scenario_service.iter_scenarios())
+        # Discovered tool closures, reused until one of the MCP sessions changes
+        self._cached_tools: list[Callable[..., Awaitable[str]]] | None = None
+        self._cached_tools_sessions: tuple[Any, ...] = ()
         
         logger.info("AgentFrameworkService initialized (Agent Framework implementation)")
 
     def list_instruction_scenarios(self) -> list[dict[str, Any]]:
         """Return a lightweight summary of parsed instruction scenarios."""
-        scenario_titles = self.scenario_service.list_all_scenario_titles()
-        scenarios = []
-        
-        for idx, title in enumerate(scenario_titles):
-            scenario = self.scenario_service.get_scenario_by_title(title)
-            if scenario:
-                scenarios.append({
-                    "index": idx,
-                    "title": scenario.title,
-                    "query_count": len(scenario.queries),
-                    "description": scenario.description.split("\n")[0][:160] if scenario.description else ""
-                })
-        
-        return scenarios
+        return [
+            {
+                "index": idx,
+                "title": scenario.title,
+                "query_count": len(scenario.queries),
+                "description": scenario.description.split("\n")[0][:160] if scenario.description else ""
+            }
+            for idx, scenario in enumerate(self.scenario_service.iter_scenarios())
+        ]
 
     async def run_instruction_scenario(self, scenario_ref: int | str) -> dict[str, Any]:
         """Execute all queries in a referenced scenario
@@ -524,16 +1174,13 @@ class AgentFrameworkService:
         scenarios directly through the Kusto MCP service.
         """
         try:
-            scenario_titles = self.scenario_service.list_all_scenario_titles()
-            
-            if not scenario_titles:
+            if not self._scenario_list:
                 raise ValueError("No scenarios available")
 
             scenario = None
             if isinstance(scenario_ref, int):
-                if 0 <= scenario_ref < len(scenario_titles):
-                    title = scenario_titles[scenario_ref]
-                    scenario = self.scenario_service.get_scenario_by_title(title)
+                if 0 <= scenario_ref < len(self._scenario_list):
+                    scenario = self._scenario_list[scenario_ref]
             else:
                 # Find by title
                 scenario = self.scenario_service.get_scenario_by_title(scenario_ref)
@@ -541,10 +1188,9 @@ class AgentFrameworkService:
                 # If not found, try partial match
                 if not scenario:
                     ref_lower = scenario_ref.lower()
-                    for title in scenario_titles:
-                        if ref_lower in title.lower():
-                            scenario = self.scenario_service.get_scenario_by_title(title)
-                            break
+                    match = next((title for title_lc, title in self.scenario_service.title_index if ref_lower in title_lc), None)
+                    if match:
+                        scenario = self.scenario_service.get_scenario_by_title(match)
 
             if scenario is None:
                 raise ValueError(f"Scenario not found: {scenario_ref}")
@@ -552,10 +1198,22 @@ class AgentFrameworkService:
             from services.kusto_mcp_service import get_kusto_service
             kusto_service = await get_kusto_service()
 
+            # Queries are independent, so run them concurrently (bounded) and keep result order
+            semaphore = asyncio.Semaphore(max(1, SCENARIO_QUERY_CONCURRENCY))
+
+            async def run_query(query: str) -> dict[str, Any]:
+                async with semaphore:
+                    return await kusto_service.execute_kusto_query(query)
+
+            results = await asyncio.gather(
+                *(run_query(q) for q in scenario.queries), return_exceptions=True
+            )
+
             tables: list[dict[str, Any]] = []
             errors: list[str] = []
-            for idx, query in enumerate(scenario.queries):
-                res = await kusto_service.execute_kusto_query(query)
+            for idx, res in enumerate(results):
+                if isinstance(res, BaseException):
+                    res = {"success": False, "error": str(res) or type(res).__name__}
                 if res.get("success"):
                     tables.append(res.get("table", {"columns": ["Result"], "rows": [["(empty)"]], "total_rows": 0}))
                 else:
@@ -603,31 +1261,18 @@ class AgentFrameworkService:
             
             # Prewarm MCP sessions with cluster/database pairs
             try:
-                all_queries: list[str] = []
-                scenario_titles = agent_framework_service.scenario_service.list_all_scenario_titles()
-                for title in scenario_titles:
-                    scenario = agent_framework_service.scenario_service.get_scenario_by_title(title)
-                    if scenario:
-                        all_queries.extend(scenario.queries)
-                
-                if all_queries:
-                    import re
-                    pair_pattern = r"cluster\([\"']([^\"']+)[\"']\)\.database\([\"']([^\"']+)[\"']\)"
-                    cluster_db_pairs: list[tuple[str, str]] = []
-                    seen_pairs: set[tuple[str, str]] = set()
-                    for q in all_queries:
-                        m = re.search(pair_pattern, q)
-                        if m:
-                            pair = (m.group(1), m.group(2))
-                            if pair not in seen_pairs:
-                                seen_pairs.add(pair)
-                                cluster_db_pairs.append(pair)
-                    if cluster_db_pairs:
-                        await kusto_service.prewarm_mcp_sessions(cluster_db_pairs)
-                    else:
-                        logger.info("No cluster/database pairs found for MCP session prewarm")
+                # Stream queries straight into the regex scan; no intermediate list of all queries
+                queries = itertools.chain.from_iterable(
+                    s.queries for s in agent_framework_service.scenario_service.iter_scenarios()
+                )
+                # dict.fromkeys dedupes while preserving first-seen order
+                cluster_db_pairs: list[tuple[str, str]] = list(dict.fromkeys(
+                    m.groups() for q in queries if (m := _CLUSTER_DB_RE.search(q))
+                ))
+                if cluster_db_pairs:
+                    await kusto_service.prewarm_mcp_sessions(cluster_db_pairs)
                 else:
-                    logger.info("No queries found for MCP prewarm")
+                    logger.info("No cluster/database pairs found for MCP session prewarm")
             except Exception as prewarm_err:  # noqa: BLE001
                 logger.warning(f"MCP session prewarm encountered issues: {prewarm_err}")
         except Exception as mcp_init_err:  # noqa: BLE001
@@ -666,6 +1311,7 @@ class AgentFrameworkService:
             reload_scenarios()
             self.scenario_service = get_scenario_service()
             scenario_titles = self.scenario_service.list_all_scenario_titles()
+            self._scenario_list = list(self.scenario_service.iter_scenarios())
             logger.info(f"Reloaded {len(scenario_titles)} instruction scenarios")
         except Exception as e:
             logger.error(f"Failed to reload scenarios: {e}")
@@ -675,13 +1321,11 @@ class AgentFrameworkService:
         try:
             logger.info("Validating authentication tokens...")
             
-            # Test cognitive services token retrieval
-            cognitive_token = await auth_service.get_cognitive_services_token()
+            # Cognitive services (Azure OpenAI) and Graph (user info) tokens come from
+            # independent endpoints, so fetch them concurrently
+            cognitive_token, graph_token = await auth_service.get_cognitive_and_graph_tokens()
             if not cognitive_token:
                 raise Exception("Failed to retrieve cognitive services token")
-            
-            # Test graph token retrieval
-            graph_token = await auth_service.get_graph_token()
             if not graph_token:
                 raise Exception("Failed to retrieve Microsoft Graph token")
                 
@@ -694,8 +1338,7 @@ class AgentFrameworkService:
             auth_service.clear_token_cache()
             
             try:
-                await auth_service.get_cognitive_services_token()
-                await auth_service.get_graph_token()
+                await auth_service.get_cognitive_and_graph_tokens()
                 logger.info("Authentication validation successful after cache clear")
             except Exception as retry_e:
                 logger.error(f"Authentication validation failed even after cache clear: {retry_e}")
@@ -709,6 +1352,7 @@ class AgentFrameworkService:
         """
         # Use the WAM credential from auth_service for consistent authentication
         # This matches the pattern used in autogen_service.py
+        from agent_framework.azure import AzureOpenAIChatClient
         return AzureOpenAIChatClient(
             endpoint=model_config.azure_endpoint,
             deployment_name=model_config.azure_deployment,
@@ -729,9 +1373,21 @@ class AgentFrameworkService:
            - 1 helper: find_device_by_id (client-side filtering workaround for API limitations)
         3. Kusto MCP execute_query only (real-time event query execution)
         4. lookup_context (conversation state)
+        
+        The result is cached and reused while the same MCP sessions are live;
+        a reconnect (new session object) triggers rediscovery.
         """
+        if self._cached_tools is not None and all(
+            a is b for a, b in zip(self._current_mcp_sessions(), self._cached_tools_sessions)
+        ):
+            logger.info(f"Reusing {len(self._cached_tools)} cached tools")
+            return list(self._cached_tools)
+        
         tools: list[Callable[..., Awaitable[str]]] = []
         
+        from services.conversation_state import get_conversation_state_service
+        context_service = get_conversation_state_service()
+        
         # Primary: Instructions MCP tools (scenario management)
         try:
             from services.instructions_mcp_service import get_instructions_service
@@ -858,7 +1514,8 @@ class AgentFrameworkService:
             if hasattr(kusto_service, '_session') and kusto_service._session:
                 # Only add execute_query from Kusto MCP
                 execute_func = create_mcp_tool_function("execute_query", 
-                    "Execute a Kusto query. Use ONLY with queries from substitute_and_get_query.")
+                    "Execute a Kusto query. Use ONLY with queries from substitute_and_get_query.",
+                    kusto_service, context_service, kusto_service._session)
                 tools.append(execute_func)
                 logger.info("Added execute_query tool from Kusto MCP")
             else:
@@ -867,12 +1524,31 @@ class AgentFrameworkService:
             logger.error(f"Failed to load Kusto MCP: {e}")
         
         # Add context lookup (but not scenario lookup - Instructions MCP handles that)
-        context_func = create_context_lookup_function()
+        context_func = create_context_lookup_function(context_service)
         tools.append(context_func)
         logger.info("Added lookup_context tool for conversation state access")
         
         logger.info(f"Total tools registered: {len(tools)}")
-        return tools
+        
+        # Only cache when every MCP server was reachable, so a missing one is retried next time
+        sessions = self._current_mcp_sessions()
+        if all(session is not None for session in sessions):
+            self._cached_tools = tools
+            self._cached_tools_sessions = sessions
+        return list(tools)
+    
+    @staticmethod
+    def _current_mcp_sessions() -> tuple[Any, Any, Any]:
+        """Peek at the (Instructions, Data Warehouse, Kusto) MCP sessions without initializing them"""
+        import services.datawarehouse_mcp_service as datawarehouse_module
+        import services.instructions_mcp_service as instructions_module
+        import services.kusto_mcp_service as kusto_module
+        
+        return (
+            getattr(instructions_module._instructions_service, "_session", None),
+            getattr(datawarehouse_module.datawarehouse_mcp_service, "_session", None),
+            getattr(kusto_module.kusto_mcp_service, "_session", None),
+        )
     
     async def create_intune_expert_agent(self, model_config: ModelConfiguration) -> ChatAgent:
         """Create the IntuneExpert agent using Agent Framework
@@ -885,120 +1561,15 @@ class AgentFrameworkService:
         # Create the Azure OpenAI chat client
         chat_client = self._create_azure_chat_client(model_config)
         
-        # SIMPLIFIED system instructions - focus on workflow, not anti-patterns
-        system_instructions = """You are an Intune Expert assistant specializing in Microsoft Intune diagnostics.
-
-Your primary role is to execute queries to retrieve and analyze Intune device information using two data sources:
-1. Data Warehouse API - For historical baseline data (devices, users, apps, policies) updated daily
-2. Kusto queries - For real-time event data and telemetry
-
-WORKFLOW:
-1. Use search_scenarios(query) to find relevant scenarios
-2. Use get_scenario(slug) to get scenario details with steps
-3. For each step in order:
-   - If step uses Data Warehouse: Use query_entity() with appropriate filters
-   - If step uses Kusto: Use substitute_and_get_query() then execute_query()
-4. Format results as tables and provide summary
-
-DATA SOURCE SELECTION:
-- Use Data Warehouse API for:
-  * Device baseline information (deviceId, deviceName, manufacturer, model, OS version)
-  * User information (userId, userPrincipalName, displayName)
-  * App installation status
-  * Policy compliance status
-  * Historical snapshots (data refreshed daily at Midnight UTC)
-  
-- Use Kusto (execute_query) for:
-  * Real-time events and telemetry
-  * Event sequences and timelines
-  * Complex joins and aggregations
-  * Custom diagnostic queries
-
-⚠️ DATA WAREHOUSE API LIMITATIONS:
-The Data Warehouse API does NOT support $filter or $select OData parameters - both cause HTTP 400 errors.
-Instead:
-- To find a specific device: Use find_device_by_id(device_id) - NOT query_entity with filter
-- To get all devices: Use query_entity(entity="devices") without filter/select parameters
-- The API returns all 39 fields per device - you cannot select specific columns
-- Client-side filtering is the only reliable method for single-device lookups
-
-AVAILABLE TOOLS:
-Scenario Management:
-- search_scenarios: Find scenarios matching keywords
-- get_scenario: Get full scenario definition  
-- get_query: Get raw query text for a specific query_id
-- substitute_and_get_query: Get executable query with placeholders filled and validated
-
-Data Warehouse API (Historical Data):
-- list_entities: List all available Data Warehouse entities
-- get_entity_schema: Get schema/properties for an entity
-- query_entity: Query entity WITHOUT filters (⚠️ $filter and $select cause HTTP 400)
-- execute_odata_query: Execute raw OData query URL (advanced use only)
-- find_device_by_id: Find a specific device by ID (RECOMMENDED for single device lookups)
-
-Kusto (Real-time Data):
-- execute_query: Run Kusto query (use ONLY with queries from substitute_and_get_query)
-
-Context:
-- lookup_context: Get stored values from previous queries
-
-CRITICAL RULES:
-1. Execute scenarios step by step in sequential order (1, 2, 3, ...)
-2. For Kusto steps: ALWAYS call substitute_and_get_query AND execute_query - both required
-3. Getting a query with substitute_and_get_query is NOT execution - you must call execute_query next
-4. For Data Warehouse device lookups: ALWAYS use find_device_by_id(device_id) - NEVER query_entity with filter
-5. For Data Warehouse bulk queries: Use query_entity(entity) without $filter or $select parameters
-6. NEVER pass filter= or select= parameters to query_entity - they cause HTTP 400 errors
-7. Don't write your own Kusto queries - use exact queries from substitute_and_get_query
-8. substitute_and_get_query validates automatically - don't call separate validation
-9. After completing ALL steps (every execute_query call), format results and provide summary
-10. Present results as formatted markdown tables
-
-⚠️ SCENARIO COMPLETION SIGNAL (MANDATORY):
-When you have completed ALL steps in a scenario and provided the summary:
-- End your response with the exact marker: **[SCENARIO_COMPLETE]**
-- This marker MUST appear on its own line at the very end of your response
-- Do NOT add this marker until ALL steps are executed and results are formatted
-- The orchestrator uses this marker to detect completion and stop the workflow
-- Example:
-  
-  (... tables and summary here ...)
-  
-  **[SCENARIO_COMPLETE]**
-
-PLACEHOLDER HANDLING:
-- Always use PascalCase: DeviceId, StartTime, EndTime, EffectiveGroupIdList
-- Call lookup_context() if you need values from previous queries
-- Pass all placeholders to substitute_and_get_query as a dictionary
-- If substitute_and_get_query returns validation errors, fix the values and retry
-
-EXAMPLE WORKFLOW (Data Warehouse + Kusto):
-1. search_scenarios(query="device timeline") → Get slug
-2. get_scenario(slug="device-timeline") → Get steps array (returns 5 steps)
-3. Step 1 (Data Warehouse - Device Baseline):
-   - find_device_by_id(device_id="abc123") → Returns device with all 39 fields
-4. Step 2 (Kusto - Events):
-   - substitute_and_get_query(query_id="device-timeline_step2", placeholder_values={"DeviceId": "abc123"})
-   - execute_query(query="<returned query>") ← REQUIRED - don't skip this
-5. Step 3 (Kusto - Events):
-   - substitute_and_get_query(query_id="device-timeline_step3", placeholder_values={"DeviceId": "abc123"})
-   - execute_query(query="<returned query>") ← REQUIRED - don't skip this
-6. Step 4 (Kusto - Events):
-   - substitute_and_get_query(query_id="device-timeline_step4", placeholder_values={"DeviceId": "abc123"})
-   - execute_query(query="<returned query>") ← REQUIRED - don't skip this
-7. Step 5 (Kusto - Events):
-   - substitute_and_get_query(query_id="device-timeline_step5", placeholder_values={"PolicyIdList": "..."})
-   - execute_query(query="<returned query>") ← REQUIRED - don't skip this
-8. After ALL execute_query calls complete, format all results and provide summary
-"""
         
         # Discover and create tools from MCP server
         tools = await self._discover_mcp_tools()
         
         # Create the agent with tools
+        from agent_framework import ChatAgent
         agent = ChatAgent(
             chat_client=chat_client,
-            instructions=system_instructions,
+            instructions=_INTUNE_EXPERT_INSTRUCTIONS,
             tools=tools
         )
         
@@ -1011,160 +1582,34 @@ EXAMPLE WORKFLOW (Data Warehouse + Kusto):
         """In strict mode, remove or flag speculative phrases if unsupported by data."""
         if not strict or not text:
             return text
-        speculative_markers = ["likely", "probably", "possible", "might", "inferred", "it is probable"]
-        has_data = bool(tables)
-        lines = text.split('\n')
-        cleaned: list[str] = []
-        for line in lines:
-            lower = line.lower()
-            if any(tok in lower for tok in speculative_markers):
-                if not has_data:
-                    continue
-                else:
-                    line += "  (Speculative wording trimmed under strict mode; verify with actual query results.)"
-            cleaned.append(line)
-        result = '\n'.join(cleaned).strip()
-        if not result:
-            return "(Strict mode removed speculative content; no factual data returned.)"
-        return result
+        return _filter_speculation(text, bool(tables))
 
     def _extract_json_objects(self, text: str) -> list[Any]:
         """Extract multiple JSON objects/lists from arbitrary concatenated text."""
-        results: list[Any] = []
-        if not text or ('{' not in text and '[' not in text):
-            return results
-        start_idx: int | None = None
-        depth = 0
-        in_string = False
-        escape = False
-        for i, ch in enumerate(text):
-            if start_idx is None:
-                if ch in '{[':
-                    start_idx = i
-                    depth = 1
-                    in_string = False
-                    escape = False
-                continue
-            if in_string:
-                if escape:
-                    escape = False
-                elif ch == '\\':
-                    escape = True
-                elif ch == '"':
-                    in_string = False
-            else:
-                if ch == '"':
-                    in_string = True
-                elif ch in '{[':
-                    depth += 1
-                elif ch in '}]':
-                    depth -= 1
-                    if depth == 0 and start_idx is not None:
-                        candidate = text[start_idx:i+1].strip()
-                        try:
-                            results.append(json.loads(candidate))
-                        except Exception:
-                            pass
-                        start_idx = None
-            if start_idx is not None and (i - start_idx) > 200_000:
-                start_idx = None
-        return results
-
-    def _clean_summary_from_json(self, text: str) -> str:
+        return _scan_json(text)[0]
+
+    def _clean_summary_from_json(self, text: str, json_ranges: list[tuple[int, int]] | None = None) -> str:
         """Remove raw JSON objects and markdown tables from text to create a clean natural language summary.
         
         This prevents the AI summary from displaying garbled table data that's already
         being shown in the Kusto Query Results table below.
+        
+        `json_ranges` may carry the spans from an earlier `_scan_json(text)`; they are
+        reused when the table cleanup leaves the text untouched, otherwise it is rescanned.
         """
         if not text:
             return text
-        
-        import re
-        cleaned = text
-        
-        # Step 1: Remove markdown tables (lines with | separators)
-        # A markdown table has:
-        # - Header row with | separators
-        # - Separator row with |---|---| pattern
-        # - Data rows with | separators
-        
-        # Remove entire markdown table blocks
-        # This regex matches from a table header through all table rows
-        markdown_table_pattern = r'\n?\s*\|[^\n]+\|\s*\n\s*\|[\s\-:|]+\|\s*\n(?:\s*\|[^\n]+\|\s*\n)+'
-        cleaned = re.sub(markdown_table_pattern, '\n', cleaned)
-        
-        # Also remove standalone table rows that might remain
-        cleaned = re.sub(r'\n\s*\|[^\n]+\|\s*\n', '\n', cleaned)
-        
-        # Step 2: Remove markdown table headers/titles (e.g., "**Device Details Table**")
-        cleaned = re.sub(r'\*\*[^*]*Table\*\*\s*\n?', '', cleaned, flags=re.IGNORECASE)
-        
-        # Step 3: Remove JSON objects
-        if '{' in cleaned or '[' in cleaned:
-            # Track JSON object positions to remove
-            start_idx: int | None = None
-            depth = 0
-            in_string = False
-            escape = False
-            json_ranges: list[tuple[int, int]] = []
-            
-            for i, ch in enumerate(cleaned):
-                if start_idx is None:
-                    if ch in '{[':
-                        start_idx = i
-                        depth = 1
-                        in_string = False
-                        escape = False
-                    continue
-                if in_string:
-                    if escape:
-                        escape = False
-                    elif ch == '\\':
-                        escape = True
-                    elif ch == '"':
-                        in_string = False
-                else:
-                    if ch == '"':
-                        in_string = True
-                    elif ch in '{[':
-                        depth += 1
-                    elif ch in '}]':
-                        depth -= 1
-                        if depth == 0 and start_idx is not None:
-                            # Found complete JSON object - mark for removal
-                            json_ranges.append((start_idx, i + 1))
-                            start_idx = None
-                if start_idx is not None and (i - start_idx) > 200_000:
-                    start_idx = None
-            
-            # Build cleaned text by excluding JSON ranges
-            if json_ranges:
-                cleaned_parts = []
-                last_end = 0
-                for start, end in json_ranges:
-                    if start > last_end:
-                        cleaned_parts.append(cleaned[last_end:start])
-                    last_end = end
-                if last_end < len(cleaned):
-                    cleaned_parts.append(cleaned[last_end:])
-                
-                cleaned = ''.join(cleaned_parts)
-        
-        # Step 4: Clean up formatting
-        # Remove multiple consecutive newlines
-        cleaned = re.sub(r'\n{3,}', '\n\n', cleaned)
-        
-        # Remove leading/trailing whitespace
-        cleaned = cleaned.strip()
-        
-        # Remove empty bullet points or list markers that might be left over
-        cleaned = re.sub(r'\n\s*[-*]\s*\n', '\n', cleaned)
-        
-        return cleaned
+        return _clean_summary_text(text, tuple(json_ranges) if json_ranges is not None else None)
 
-    def _normalize_table_objects(self, objs: list[Any]) -> list[dict[str, Any]]:
-        """Normalize heterogeneous JSON shapes into table dictionaries."""
+    def _normalize_table_objects(self, objs: list[Any], dedupe: bool = False) -> list[dict[str, Any]]:
+        """Normalize heterogeneous JSON shapes into table dictionaries.
+        
+        With `dedupe`, each table is checked against the content signatures seen so far
+        as it is produced, giving the same result as `_dedupe_tables` on the output
+        without ever holding the duplicates.
+        """
         tables: list[dict[str, Any]] = []
+        seen: set[bytes] | None = set() if dedupe else None
         def add(columns: list[Any], rows: list[list[Any]], total_rows: int | None = None, name: str | None = None):
             tbl: dict[str, Any] = {
                 'columns': columns,
@@ -1172,45 +1617,69 @@ EXAMPLE WORKFLOW (Data Warehouse + Kusto):
                 'total_rows': total_rows if total_rows is not None else len(rows)
             }
             if name:
-                tbl['name'] = name
+                tbl['name'] = sys.intern(name)
+            if seen is not None:
+                sig = _table_signature(tbl)
+                if sig in seen:
+                    return
+                seen.add(sig)
             tables.append(tbl)
 
         def from_data_rows(obj: dict[str, Any]):
             data_rows_any = obj.get('data')
             if isinstance(data_rows_any, list) and data_rows_any and all(isinstance(r, dict) for r in data_rows_any):
-                columns: list[str] = []
-                for r in data_rows_any:
-                    for k in r.keys():
-                        if k not in columns:
-                            columns.append(k)
-                row_matrix = [[str(r.get(c, '')) for c in columns] for r in data_rows_any]
+                # dict.fromkeys gives an insertion-ordered union of keys with O(1) membership;
+                # names are interned since the same Kusto columns recur across tables and runs
+                columns: list[str] = [
+                    sys.intern(k) if type(k) is str else k
+                    for k in dict.fromkeys(k for r in data_rows_any for k in r)
+                ]
+                # map() keeps the per-cell get/str calls in C instead of a nested comprehension
+                blanks = itertools.repeat('')
+                ncols = len(columns)
+                if ncols > 1:
+                    # A row with as many keys as the column union holds every column, so a
+                    # single itemgetter call fetches all cells; sparse rows fall back to get()
+                    getter = operator.itemgetter(*columns)
+                    row_matrix = [
+                        list(map(str, getter(r))) if len(r) == ncols else list(map(str, map(r.get, columns, blanks)))
+                        for r in data_rows_any
+                    ]
+                else:
+                    row_matrix = [list(map(str, map(r.get, columns, blanks))) for r in data_rows_any]
                 add(columns, row_matrix, name=str(obj.get('name')) if obj.get('name') else None)
 
-        queue: list[Any] = list(objs)
+        queue: deque[Any] = deque(objs)
         while queue:
-            obj = queue.pop(0)
+            obj = queue.popleft()
             if isinstance(obj, list):
-                queue[:0] = obj
+                # Nested items go to the front, in order, so output order is unchanged
+                queue.extendleft(reversed(obj))
                 continue
             if not isinstance(obj, dict):
                 continue
-            if 'table' in obj and isinstance(obj['table'], dict):
-                tbl = obj['table']
-                if all(k in tbl for k in ('columns', 'rows')):
-                    add(tbl.get('columns', []), tbl.get('rows', []), tbl.get('total_rows'), name=str(obj.get('name')) if obj.get('name') else None)
-            if 'columns' in obj and 'rows' in obj and isinstance(obj.get('columns'), list):
+            # One table per object: hybrid shapes (e.g. a 'table' wrapper that also repeats
+            # columns/rows at the top level) would otherwise be added once per branch
+            tbl = obj.get('table')
+            if isinstance(tbl, dict) and 'columns' in tbl and 'rows' in tbl:
+                add(tbl.get('columns', []), tbl.get('rows', []), tbl.get('total_rows'), name=str(obj.get('name')) if obj.get('name') else None)
+            elif 'columns' in obj and 'rows' in obj and isinstance(obj.get('columns'), list):
                 add(obj.get('columns', []), obj.get('rows', []), obj.get('total_rows'), name=str(obj.get('name')) if obj.get('name') else None)
-            if 'data' in obj and isinstance(obj.get('data'), list):
+            elif isinstance(obj.get('data'), list):
                 from_data_rows(obj)
         return tables
 
     def _dedupe_tables(self, tables: list[dict[str, Any]]) -> list[dict[str, Any]]:
-        """Remove duplicate tables based on structure signature."""
-        seen: set[str] = set()
+        """Remove duplicate tables based on a content signature."""
+        seen_ids: set[int] = set()
+        seen: set[bytes] = set()
         unique: list[dict[str, Any]] = []
         for t in tables:
-            name = t.get('name') or ''
-            sig = f"{name}:{tuple(t.get('columns', []))}:{len(t.get('rows', []))}"
+            # The same dict object listed twice is a duplicate without hashing its rows
+            if id(t) in seen_ids:
+                continue
+            seen_ids.add(id(t))
+            sig = _table_signature(t)
             if sig not in seen:
                 seen.add(sig)
                 unique.append(t)
@@ -1227,17 +1696,23 @@ EXAMPLE WORKFLOW (Data Warehouse + Kusto):
                    MagenticAgentMessageEvent, or MagenticFinalResultEvent
         """
         try:
+            (
+                MagenticOrchestratorMessageEvent,
+                MagenticAgentDeltaEvent,
+                MagenticAgentMessageEvent,
+                MagenticFinalResultEvent,
+            ) = _magentic_event_classes()
             from services.scenario_state import scenario_tracker
             
             if isinstance(event, MagenticOrchestratorMessageEvent):
                 # Orchestrator messages (planning, task ledger, instructions, notices)
-                message = getattr(event, 'message', None)
+                message_text = _event_message_text(event)
                 kind = getattr(event, 'kind', 'unknown')
                 
-                if message:
-                    message_text = getattr(message, 'text', '')
-                    truncated = message_text[:300] + "..." if len(message_text) > 300 else message_text
-                    logger.info(f"[Magentic-Orchestrator] [{kind}] {truncated}")
+                if message_text is not None:
+                    if logger.isEnabledFor(logging.INFO):
+                        truncated = message_text[:300] + "..." if len(message_text) > 300 else message_text
+                        logger.info("[Magentic-Orchestrator] [%s] %s", kind, truncated)
             
             elif isinstance(event, MagenticAgentDeltaEvent):
                 # Agent streaming deltas (real-time response chunks)
@@ -1251,12 +1726,12 @@ EXAMPLE WORKFLOW (Data Warehouse + Kusto):
                 fn_result = getattr(event, 'function_result', None)
                 
                 if fn_call_name:
-                    logger.info(f"[Magentic-Agent-{agent_id}] Function call: {fn_call_name}")
+                    logger.info("[Magentic-Agent-%s] Function call: %s", agent_id, fn_call_name)
                     
                     # Track scenario initialization
                     if fn_call_name == "get_scenario" and fn_result:
                         try:
-                            result_data = json.loads(fn_result) if isinstance(fn_result, str) else fn_result
+                            result_data = _loads(fn_result) if isinstance(fn_result, str) else fn_result
                             if isinstance(result_data, dict) and 'steps' in result_data:
                                 slug = result_data.get('slug', 'unknown')
                                 scenario_tracker.start_scenario(slug, result_data['steps'])
@@ -1276,36 +1751,37 @@ EXAMPLE WORKFLOW (Data Warehouse + Kusto):
                                 # Store result in buffer for table extraction
                                 if isinstance(fn_result, str):
                                     try:
-                                        result_obj = json.loads(fn_result)
+                                        result_obj = _loads(fn_result)
                                         if isinstance(result_obj, dict) and result_obj.get('success') and 'table' in result_obj:
-                                            TOOL_RESULTS_BUFFER.append(result_obj)
-                                            logger.debug(f"Added query result to buffer (total: {len(TOOL_RESULTS_BUFFER)})")
+                                            tool_results = _tool_results_buffer()
+                                            tool_results.append(result_obj)
+                                            logger.debug("Added query result to buffer (total: %d)", len(tool_results))
                                     except Exception:
                                         pass
                 
                 elif fn_result_id:
-                    logger.info(f"[Magentic-Agent-{agent_id}] Function result received")
+                    logger.info("[Magentic-Agent-%s] Function result received", agent_id)
                 elif text:
-                    logger.info(f"[Magentic-Agent-{agent_id}] ({role}): {text[:100]}")
+                    logger.info("[Magentic-Agent-%s] (%s): %.100s", agent_id, role, text)
             
             elif isinstance(event, MagenticAgentMessageEvent):
                 # Complete agent message (final aggregated response)
                 agent_id = getattr(event, 'agent_id', 'agent')
-                message = getattr(event, 'message', None)
+                message_text = _event_message_text(event)
                 
-                if message:
-                    message_text = getattr(message, 'text', '')
-                    role = getattr(message, 'role', 'unknown')
-                    truncated = message_text[:300] + "..." if len(message_text) > 300 else message_text
-                    logger.info(f"[Magentic-Agent-{agent_id}] ({role}) Final: {truncated}")
+                if message_text is not None:
+                    role = getattr(event.message, 'role', 'unknown')
+                    if logger.isEnabledFor(logging.INFO):
+                        truncated = message_text[:300] + "..." if len(message_text) > 300 else message_text
+                        logger.info("[Magentic-Agent-%s] (%s) Final: %s", agent_id, role, truncated)
             
             elif isinstance(event, MagenticFinalResultEvent):
                 # Final workflow result
-                message = getattr(event, 'message', None)
-                if message:
-                    message_text = getattr(message, 'text', '')
-                    truncated = message_text[:300] + "..." if len(message_text) > 300 else message_text
-                    logger.info(f"[Magentic-FinalResult] {truncated}")
+                message_text = _event_message_text(event)
+                if message_text is not None:
+                    if logger.isEnabledFor(logging.INFO):
+                        truncated = message_text[:300] + "..." if len(message_text) > 300 else message_text
+                        logger.info("[Magentic-FinalResult] %s", truncated)
                 
                 # Log final scenario progress
                 scenario = scenario_tracker.get_active_scenario()
@@ -1388,6 +1864,7 @@ DO NOT OUTPUT ANYTHING OTHER THAN JSON, AND DO NOT DEVIATE FROM THIS SCHEMA:
     }}
 }}"""
             
+            from agent_framework import MagenticBuilder
             self.magentic_workflow = (
                 MagenticBuilder()
                 .participants(IntuneExpert=self.intune_expert_agent)
@@ -1475,7 +1952,8 @@ DO NOT OUTPUT ANYTHING OTHER THAN JSON, AND DO NOT DEVIATE FROM THIS SCHEMA:
                 if pascal_key not in placeholder_values:
                     placeholder_values[pascal_key] = _normalize_placeholder_value(pascal_key, context_value)
         
-        logger.info(f"[AgentFramework] Built placeholder values with {len(placeholder_values)} keys: {list(placeholder_values.keys())}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("[AgentFramework] Built placeholder values with %d keys: %s", len(placeholder_values), list(placeholder_values.keys()))
         
         return placeholder_values
 
@@ -1493,7 +1971,7 @@ DO NOT OUTPUT ANYTHING OTHER THAN JSON, AND DO NOT DEVIATE FROM THIS SCHEMA:
             logger.info(f"Executing diagnostic query: {query_type}")
             
             # Clear state and buffers for fresh execution
-            TOOL_RESULTS_BUFFER.clear()
+            tool_results = _new_tool_results_buffer()
             scenario_tracker.clear_scenario()
             
             from services.conversation_state import get_conversation_state_service
@@ -1528,7 +2006,8 @@ DO NOT OUTPUT ANYTHING OTHER THAN JSON, AND DO NOT DEVIATE FROM THIS SCHEMA:
             # Get all available context values
             context_values = context_service.get_all_context()
             
-            logger.info(f"[AgentFramework] Available context values: {list(context_values.keys())}")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("[AgentFramework] Available context values: %s", list(context_values.keys()))
             
             # Build complete placeholder values with proper PascalCase conversion
             all_placeholder_values = self._build_placeholder_values(parameters, context_values)
@@ -1612,6 +2091,7 @@ Actions speak louder than words - call the tools, don't announce them."""
             scenario_complete = False  # Track completion marker
             
             # Import event types for proper type checking
+            from agent_framework import WorkflowOutputEvent
             from agent_framework._workflows._magentic import (
                 MagenticOrchestratorMessageEvent,
                 MagenticAgentDeltaEvent,
@@ -1622,12 +2102,12 @@ Actions speak louder than words - call the tools, don't announce them."""
             async for event in self.magentic_workflow.run_stream(query_message):
                 # Log orchestrator messages (task, ledger, instructions, notices)
                 if isinstance(event, MagenticOrchestratorMessageEvent):
-                    message = getattr(event, 'message', None)
+                    message_text = _event_message_text(event)
                     kind = getattr(event, 'kind', 'unknown')
-                    if message:
-                        message_text = getattr(message, 'text', '')
-                        truncated = message_text[:300] + "..." if len(message_text) > 300 else message_text
-                        logger.info(f"[Magentic-Orchestrator] [{kind}] {truncated}")
+                    if message_text is not None:
+                        if logger.isEnabledFor(logging.INFO):
+                            truncated = message_text[:300] + "..." if len(message_text) > 300 else message_text
+                            logger.info("[Magentic-Orchestrator] [%s] %s", kind, truncated)
                 
                 # Log agent streaming deltas
                 elif isinstance(event, MagenticAgentDeltaEvent):
@@ -1636,19 +2116,19 @@ Actions speak louder than words - call the tools, don't announce them."""
                     fn_call_name = getattr(event, 'function_call_name', None)
                     
                     if fn_call_name:
-                        logger.info(f"[Magentic-Agent-{agent_id}] Function call: {fn_call_name}")
+                        logger.info("[Magentic-Agent-%s] Function call: %s", agent_id, fn_call_name)
                     elif text:
                         # Only log first 100 chars of streaming text to avoid spam
-                        logger.debug(f"[Magentic-Agent-{agent_id}] {text[:100]}")
+                        logger.debug("[Magentic-Agent-%s] %.100s", agent_id, text)
                 
                 # Log complete agent messages AND check for completion marker
                 elif isinstance(event, MagenticAgentMessageEvent):
                     agent_id = getattr(event, 'agent_id', 'agent')
-                    message = getattr(event, 'message', None)
-                    if message:
-                        message_text = getattr(message, 'text', '')
-                        truncated = message_text[:300] + "..." if len(message_text) > 300 else message_text
-                        logger.info(f"[Magentic-Agent-{agent_id}] Complete: {truncated}")
+                    message_text = _event_message_text(event)
+                    if message_text is not None:
+                        if logger.isEnabledFor(logging.INFO):
+                            truncated = message_text[:300] + "..." if len(message_text) > 300 else message_text
+                            logger.info("[Magentic-Agent-%s] Complete: %s", agent_id, truncated)
                         
                         # Check for completion marker in agent messages
                         if "[SCENARIO_COMPLETE]" in message_text:
@@ -1659,10 +2139,9 @@ Actions speak louder than words - call the tools, don't announce them."""
                 
                 # Log final result
                 elif isinstance(event, MagenticFinalResultEvent):
-                    message = getattr(event, 'message', None)
-                    if message:
-                        message_text = getattr(message, 'text', '')
-                        logger.info(f"[Magentic-Final] Task completed")
+                    message_text = _event_message_text(event)
+                    if message_text is not None:
+                        logger.info("[Magentic-Final] Task completed")
                         
                         # Also check completion marker in final result
                         if "[SCENARIO_COMPLETE]" in message_text:
@@ -1674,30 +2153,7 @@ Actions speak louder than words - call the tools, don't announce them."""
                 # Capture the final output
                 if isinstance(event, WorkflowOutputEvent):
                     logger.info("[Magentic] Received WorkflowOutputEvent - extracting response")
-                    data = getattr(event, 'data', None)
-                    extracted_text = ""
-                    try:
-                        if data is None:
-                            extracted_text = ""
-                        elif hasattr(data, 'text') and data.text:
-                            extracted_text = data.text  # type: ignore[assignment]
-                        elif hasattr(data, 'content') and data.content:
-                            extracted_text = str(data.content)
-                        elif hasattr(data, 'contents') and data.contents:
-                            contents = data.contents
-                            try:
-                                extracted_text = " ".join(
-                                    c.text for c in contents if hasattr(c, 'text') and c.text
-                                )
-                            except Exception:  # noqa: BLE001
-                                extracted_text = ""
-                            if not extracted_text:
-                                extracted_text = str(data)
-                        else:
-                            extracted_text = str(data)
-                    except Exception as extract_err:  # noqa: BLE001
-                        logger.warning(f"Failed to extract text from workflow output: {extract_err}")
-                        extracted_text = str(data) if data else ""
+                    extracted_text = _workflow_output_text(getattr(event, 'data', None))
                     response_content = extracted_text
                     
                     # Check for SCENARIO_COMPLETE marker in workflow output
@@ -1712,8 +2168,8 @@ Actions speak louder than words - call the tools, don't announce them."""
                 logger.warning("[Magentic] ⚠️ Workflow ended without SCENARIO_COMPLETE marker - may be incomplete")
             
             # Extract tables from buffer (populated by event callback)
-            if TOOL_RESULTS_BUFFER:
-                for result in TOOL_RESULTS_BUFFER:
+            if tool_results:
+                for result in tool_results:
                     if 'table' in result:
                         tables.append(result['table'])
                 logger.info(f"Extracted {len(tables)} tables from buffer")
@@ -1721,12 +2177,14 @@ Actions speak louder than words - call the tools, don't announce them."""
             # Extract mermaid timeline if present in final response
             mermaid_block: str | None = None
             if isinstance(response_content, str):
-                pattern = re.compile(r"```mermaid\s+([\s\S]*?)```", re.IGNORECASE)
-                match = pattern.search(response_content)
+                match = _MERMAID_RE.search(response_content)
                 if match:
                     mermaid_block = match.group(1).strip()
-                elif "timeline" in response_content.lower():
-                    lines = response_content.splitlines()
+                elif (timeline_match := _TIMELINE_RE.search(response_content)) is not None:
+                    # No line before the first "timeline" mention can start the block, so the
+                    # line scan begins at that line instead of the top of the response
+                    line_start = response_content.rfind('\n', 0, timeline_match.start()) + 1
+                    lines = response_content[line_start:].splitlines()
                     collected: list[str] = []
                     capture = False
                     for ln in lines:
@@ -1784,63 +2242,62 @@ Actions speak louder than words - call the tools, don't announce them."""
             logger.info(f"Processing chat message through direct agent execution: {message[:100]}...")
 
             # Incorporate prior conversation history
-            history = []
-            if extra_parameters and isinstance(extra_parameters.get("conversation_history"), list):
-                raw_hist = extra_parameters.get("conversation_history")
-                # Ensure raw_hist is not None before iterating
-                if raw_hist:
-                    for h in raw_hist:
-                        if not isinstance(h, dict):
-                            continue
-                        role = h.get("role")
-                        content = h.get("content")
-                        if not (isinstance(role, str) and isinstance(content, str)):
-                            continue
-                        if len(content) > 4000:
-                            content = content[:4000] + "... [truncated]"
-                        history.append({"role": role, "content": content})
+            history: list[dict[str, str]] = []
+            raw_hist = extra_parameters.get("conversation_history") if extra_parameters else None
+            if isinstance(raw_hist, list) and raw_hist:
+                # Sized once from the input and trimmed to the valid turns afterwards
+                history = [{}] * len(raw_hist)
+                kept = 0
+                for h in raw_hist:
+                    if not isinstance(h, dict):
+                        continue
+                    role = h.get("role")
+                    content = h.get("content")
+                    if not (isinstance(role, str) and isinstance(content, str)):
+                        continue
+                    if len(content) > 4000:
+                        content = content[:4000] + "... [truncated]"
+                    history[kept] = {"role": role, "content": content}
+                    kept += 1
+                del history[kept:]
 
             strict_mode = bool(extra_parameters.get("strict_mode")) if extra_parameters else False
 
-            # Build the composite task with history and guardrails
+            # Build the agent input. With history, the fixed system guardrail leads (a byte-stable
+            # prefix across turns), then the summary of older turns and the recent turns verbatim.
+            agent_input: str | list[ChatMessage]
             if history:
-                history_lines = []
-                for turn in history:
-                    role_tag = "USER" if turn["role"] == "user" else "ASSISTANT"
-                    history_lines.append(f"{role_tag}: {turn['content']}")
-                guardrail = """
-STRICT RESPONSE CONSTRAINTS:
-- ALWAYS use lookup_scenarios to find the appropriate query for the user's request
-- EXECUTE the exact query from instructions.md - do not skip query execution
-- Do NOT create analysis, fact sheets, or speculation - execute queries and return table results
-- Only report data that comes from successful query results
-- If a query fails, report the error and ask for guidance
-- Use lookup_context to get stored values for placeholders in queries
-""" if strict_mode else ""
-                composite_task = (
-                    ("The following is the prior conversation (most recent last). Use it to maintain context such as referenced device IDs or other identifiers.\n" + "\n".join(history_lines) + "\n\n")
-                    + (guardrail)
-                    + "New USER message: " + message + "\nRespond taking earlier context into account."
-                )
+                from agent_framework import ChatMessage, Role
+
+                # The client resends the full history each turn, so the summary is rebuilt
+                # from every turn before the verbatim tail; nothing is silently dropped
+                verbatim_turns = max(1, CHAT_HISTORY_VERBATIM_TURNS)
+                older_turns = history[:-verbatim_turns]
+                recent_turns = history[-verbatim_turns:]
+
+                chat_messages: list[ChatMessage] = []
+                if strict_mode:
+                    chat_messages.append(ChatMessage(role=Role.SYSTEM, text=_STRICT_HISTORY_GUARDRAIL))
+                if older_turns:
+                    chat_messages.append(ChatMessage(role=Role.SYSTEM, text=_summarize_history(older_turns)))
+                for turn in recent_turns:
+                    turn_role = Role.USER if turn["role"] == "user" else Role.ASSISTANT
+                    chat_messages.append(ChatMessage(role=turn_role, text=turn["content"]))
+                chat_messages.append(ChatMessage(role=Role.USER, text=message))
+                agent_input = chat_messages
+                logger.info(f"[DirectAgent] Running agent with {len(history)} history turn(s) ({len(older_turns)} summarized): {message[:100]}...")
             else:
                 if strict_mode:
-                    composite_task = (
-                        "STRICT RESPONSE MODE:\n" 
-                        "- ALWAYS start by calling lookup_scenarios with the user's request\n"
-                        "- EXECUTE the queries returned by lookup_scenarios - do not skip execution\n"
-                        "- Use lookup_context to get stored values if queries have placeholders\n"
-                        "- Only return factual data from query results, no speculation\n\n"
-                        f"User message: {message}"
-                    )
+                    agent_input = f"{_STRICT_NO_HISTORY_PREFIX}User message: {message}"
                 else:
-                    composite_task = message
+                    agent_input = message
+                logger.info(f"[DirectAgent] Running agent with message: {agent_input[:100]}...")
 
             # Run the agent directly (no orchestrator)
-            logger.info(f"[DirectAgent] Running agent with message: {composite_task[:100]}...")
-            TOOL_RESULTS_BUFFER.clear()
+            tool_results = _new_tool_results_buffer()
             
             # Direct agent execution - returns AgentRunResponse
-            response = await self.intune_expert_agent.run(composite_task)
+            response = await self.intune_expert_agent.run(agent_input)
             
             # Extract response text
             response_content = response.text if hasattr(response, 'text') else str(response)
@@ -1848,46 +2305,49 @@ STRICT RESPONSE CONSTRAINTS:
             
             # Extract tables from function results in response messages
             extracted_objs = []
-            try:
-                from agent_framework._types import FunctionResultContent
-            except ImportError:
-                from agent_framework import FunctionResultContent
-            
-            # Check response messages for function results
-            if hasattr(response, 'messages'):
-                for msg in response.messages:
-                    if hasattr(msg, 'contents'):
-                        for content in msg.contents:
-                            if isinstance(content, FunctionResultContent) and hasattr(content, 'result'):
-                                result_data = content.result
-                                logger.debug(f"[DirectAgent] FunctionResultContent detected (type={type(result_data)})")
-                                if isinstance(result_data, dict):
-                                    extracted_objs.append(result_data)
-                                elif isinstance(result_data, str):
-                                    try:
-                                        parsed = json.loads(result_data)
-                                        if isinstance(parsed, dict):
-                                            extracted_objs.append(parsed)
-                                    except json.JSONDecodeError:
-                                        multi = self._extract_json_objects(result_data)
-                                        if multi:
-                                            extracted_objs.extend(obj for obj in multi if isinstance(obj, dict))
+            FunctionResultContent = _function_result_content_class()
+            
+            # Check response messages for function results; dispatch on the content type
+            # alone since every FunctionResultContent carries a result attribute
+            for msg in getattr(response, 'messages', None) or ():
+                for content in getattr(msg, 'contents', None) or ():
+                    if isinstance(content, FunctionResultContent):
+                        result_data = content.result
+                        logger.debug("[DirectAgent] FunctionResultContent detected (type=%s)", type(result_data))
+                        if isinstance(result_data, dict):
+                            extracted_objs.append(result_data)
+                        elif isinstance(result_data, str):
+                            # Only a whole-document object is kept, so anything else skips the
+                            # full parse attempt(s) and goes straight to the embedded-JSON scan
+                            parsed: Any = None
+                            if _LEADING_JSON_OBJECT_RE.match(result_data):
+                                try:
+                                    parsed = _loads(result_data)
+                                except json.JSONDecodeError:
+                                    parsed = None
+                            if isinstance(parsed, dict):
+                                extracted_objs.append(parsed)
+                            else:
+                                multi = self._extract_json_objects(result_data)
+                                if multi:
+                                    extracted_objs.extend(obj for obj in multi if isinstance(obj, dict))
             
             logger.info(f"[DirectAgent] Extracted {len(extracted_objs)} objects from function results")
             
             # If no objects from function results, try extracting from text response (fallback)
+            text_json_ranges: list[tuple[int, int]] | None = None
             if not extracted_objs:
                 logger.info("[DirectAgent] No function results found, trying to extract from response text")
-                extracted_objs = self._extract_json_objects(response_content)
+                # Keep the spans so the summary cleanup below need not rescan the same text
+                extracted_objs, text_json_ranges = _scan_json(response_content)
                 logger.info(f"[DirectAgent] Extracted {len(extracted_objs)} JSON objects from response text")
             
-            tables_all = self._normalize_table_objects(extracted_objs)
-            unique_tables = self._dedupe_tables(tables_all)
+            unique_tables = self._normalize_table_objects(extracted_objs, dedupe=True)
 
             # Fallback buffer for chat path
-            if (not unique_tables) and TOOL_RESULTS_BUFFER:
+            if (not unique_tables) and tool_results:
                 buffered_tables: list[dict[str, Any]] = []
-                for entry in TOOL_RESULTS_BUFFER:
+                for entry in tool_results:
                     table_obj = entry.get("table") if isinstance(entry, dict) else None
                     if isinstance(table_obj, dict) and table_obj.get("columns") and table_obj.get("rows"):
                         buffered_tables.append({
@@ -1898,7 +2358,7 @@ STRICT RESPONSE CONSTRAINTS:
                 if buffered_tables:
                     unique_tables = self._dedupe_tables(buffered_tables)
                     logger.info(f"[DirectAgent] Chat fallback buffer recovered {len(unique_tables)} table(s)")
-                TOOL_RESULTS_BUFFER.clear()
+                tool_results.clear()
             
             if unique_tables:
                 logger.info(f"[DirectAgent] Found {len(unique_tables)} unique tables")
@@ -1907,7 +2367,7 @@ STRICT RESPONSE CONSTRAINTS:
 
             # Clean the response by removing raw JSON objects (they're already in tables)
             # This prevents the AI summary from showing garbled table data
-            clean_response = self._clean_summary_from_json(response_content)
+            clean_response = self._clean_summary_from_json(response_content, text_json_ranges)
             
             return {
                 "message": message,
@@ -1925,38 +2385,20 @@ STRICT RESPONSE CONSTRAINTS:
         """Fallback method for simple intent detection"""
         logger.info(f"Using fallback intent detection: {message[:100]}...")
         
-        # Extract any obvious identifiers from the message
-        guid_match = re.search(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b", message)
-        
-        # Check for scenario references
-        scenario_titles = self.scenario_service.list_all_scenario_titles()
-        if scenario_titles:
-            message_lower = message.lower()
-            for title in scenario_titles:
-                title_lower = title.lower()
-                if title_lower and (title_lower in message_lower or any(word in title_lower for word in message_lower.split() if len(word) > 3)):
-                    logger.info(f"Scenario match found: {title}")
-                    return await self.query_diagnostics("scenario", {"scenario": title})
-        
-        # Simple intent mapping as fallback
-        intent_keywords = {
-            "device_details": ["device", "details", "information", "info", "properties"],
-            "compliance": ["compliance", "compliant", "policy", "complies"],
-            "applications": ["app", "application", "software", "install"],
-            "user_lookup": ["user", "owner", "who"],
-            "tenant_info": ["tenant", "organization", "company"],
-            "effective_groups": ["group", "membership", "assigned"],
-            "mam_policy": ["mam", "mobile", "management"]
-        }
+        # Check for scenario references (no awaits before this: title matching and the
+        # intent/GUID regexes below are in-memory, so there is no I/O to overlap)
+        title = self.scenario_service.match_scenario_title(message)
+        if title:
+            logger.info(f"Scenario match found: {title}")
+            return await self.query_diagnostics("scenario", {"scenario": title})
         
-        detected_intent = None
-        for intent, keywords in intent_keywords.items():
-            if any(keyword in message.lower() for keyword in keywords):
-                detected_intent = intent
-                break
+        # Simple intent mapping as fallback (first intent in priority order wins)
+        intent_match = _FALLBACK_INTENT_RE.match(message.lower())
+        detected_intent = intent_match.lastgroup if intent_match else None
         
-        # Build parameters
+        # Build parameters, extracting any obvious identifiers from the message
         params = extra_parameters.copy() if extra_parameters else {}
+        guid_match = _GUID_RE.search(message)
         if guid_match:
             params.setdefault("device_id", guid_match.group(0))
         
@@ -1,3 +1,4 @@
+import asyncio
 import os
 import time
 from typing import Optional, Dict, Tuple
@@ -147,8 +148,11 @@ class AuthService:
         
         # For background services - use Azure CLI (no prompts)
         logger.debug(f"Getting token for {target_scope} using default credential (non-interactive)")
+        # Resolve the lazy credential on the loop thread; the blocking get_token runs in a worker
+        # so concurrent token fetches (different scopes) overlap instead of stalling the loop
+        credential = self.credential
         try:
-            token = self.credential.get_token(target_scope)
+            token = await asyncio.to_thread(credential.get_token, target_scope)
             self._token_cache[target_scope] = (float(getattr(token, 'expires_on', now + 3000)), token.token)
             return token.token
         except ClientAuthenticationError as e:
@@ -180,6 +184,20 @@ class AuthService:
         """Get access token specifically for Microsoft Graph"""
         return await self.get_access_token(self.graph_scope)
     
+    async def get_cognitive_and_graph_tokens(self) -> Tuple[str, str]:
+        """Fetch the cognitive services and Graph tokens concurrently (independent endpoints)"""
+        cognitive_token, graph_token = await asyncio.gather(
+            self.get_cognitive_services_token(),
+            self.get_graph_token(),
+            return_exceptions=True,
+        )
+        # Both requests have settled; surface the first failure
+        if isinstance(cognitive_token, BaseException):
+            raise cognitive_token
+        if isinstance(graph_token, BaseException):
+            raise graph_token
+        return cognitive_token, graph_token
+    
     async def get_intune_datawarehouse_token(self) -> str:
         """Get access token specifically for Intune Data Warehouse API"""
         return await self.get_access_token(self.intune_api_scope)
@@ -1,3 +1,5 @@
+import io
+import itertools
 import json
 import logging
 import re
@@ -8,6 +10,9 @@ from typing import Any
 # Logging is configured in main.py
 logger = logging.getLogger(__name__)
 
+# Opening bracket of an embedded JSON object/array
+_JSON_OPEN_RE = re.compile(r'[{\[]')
+
 from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.conditions import MaxMessageTermination
 from autogen_agentchat.teams import MagenticOneGroupChat
@@ -43,19 +48,24 @@ def create_scenario_lookup_function() -> Callable[..., Awaitable[str]]:
             scenarios = scenario_service.get_scenarios_by_titles(matching_titles)
             
             # Format response
-            response_parts = ["Found matching diagnostic scenarios:\n"]
+            buf = io.StringIO()
+            buf.write("Found matching diagnostic scenarios:\n")
+            total_queries = 0
             
             for i, scenario in enumerate(scenarios, 1):
-                response_parts.append(f"## {i}. {scenario.title}")
-                response_parts.append(f"**Description:** {scenario.description}")
-                response_parts.append("**Queries:**")
+                buf.write(f"\n## {i}. {scenario.title}\n**Description:** {scenario.description}\n**Queries:**")
                 
-                for j, query in enumerate(scenario.queries, 1):
-                    response_parts.append(f"```kusto\n{query}\n```")
+                for query in scenario.queries:
+                    buf.write("\n```kusto\n")
+                    buf.write(query)
+                    buf.write("\n```")
+                total_queries += len(scenario.queries)
                 
-                response_parts.append("")  # Add spacing
+                buf.write("\n")  # Add spacing
             
-            return "\n".join(response_parts)
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Returning %d scenarios with %d queries", len(scenarios), total_queries)
+            return buf.getvalue()
             
         except Exception as e:
             logger.error(f"Error in scenario lookup: {e}")
@@ -84,8 +94,11 @@ def create_context_lookup_function() -> Callable[..., Awaitable[str]]:
                 # Return all available context
                 all_context = context_service.get_all_context()
                 if all_context:
-                    context_lines = [f"{k}: {v}" for k, v in all_context.items()]
-                    return "Available conversation context:\n" + "\n".join(context_lines)
+                    # Header and entries go through one join, so the result is built in a single copy
+                    return "\n".join(itertools.chain(
+                        ("Available conversation context:",),
+                        (f"{k}: {v}" for k, v in all_context.items()),
+                    ))
                 else:
                     return "No conversation context available."
                     
@@ -190,6 +203,8 @@ class AgentService:
         from services.scenario_lookup_service import reload_scenarios
         reload_scenarios()
         self.scenario_service = get_scenario_service()
+        # Rendered system message for create_intune_expert_agent; cleared on scenario reload
+        self._system_message_cache: str | None = None
 
     def list_instruction_scenarios(self) -> list[dict[str, Any]]:
         """Return a lightweight summary of parsed instruction scenarios."""
@@ -359,6 +374,7 @@ class AgentService:
             from services.scenario_lookup_service import reload_scenarios
             reload_scenarios()
             self.scenario_service = get_scenario_service()
+            self._system_message_cache = None
             scenario_titles = self.scenario_service.list_all_scenario_titles()
             logger.info(f"Reloaded {len(scenario_titles)} instruction scenarios")
         except Exception as e:
@@ -369,13 +385,11 @@ class AgentService:
         try:
             logger.info("Validating authentication tokens...")
             
-            # Test cognitive services token retrieval (this is what Azure OpenAI uses)
-            cognitive_token = await auth_service.get_cognitive_services_token()
+            # Cognitive services (Azure OpenAI) and Graph (user info) tokens come from
+            # independent endpoints, so fetch them concurrently
+            cognitive_token, graph_token = await auth_service.get_cognitive_and_graph_tokens()
             if not cognitive_token:
                 raise Exception("Failed to retrieve cognitive services token")
-            
-            # Test graph token retrieval (for user info)  
-            graph_token = await auth_service.get_graph_token()
             if not graph_token:
                 raise Exception("Failed to retrieve Microsoft Graph token")
                 
@@ -390,8 +404,7 @@ class AgentService:
             
             try:
                 # Force fresh token retrieval
-                await auth_service.get_cognitive_services_token()
-                await auth_service.get_graph_token()
+                await auth_service.get_cognitive_and_graph_tokens()
                 logger.info("Authentication validation successful after cache clear")
             except Exception as retry_e:
                 logger.error(f"Authentication validation failed even after cache clear: {retry_e}")
@@ -476,12 +489,9 @@ class AgentService:
             logger.error(f"Failed to discover MCP tools: {e}")
             return []
     
-    async def create_intune_expert_agent(self, model_config: ModelConfiguration) -> AssistantAgent:
-        """Create the IntuneExpert agent with Kusto MCP tools access"""
-        logger.info("Creating Intune Expert agent with Kusto MCP tools")
-        model_client = self._create_azure_model_client(model_config)
-        
-        system_message = f"""
+    def _render_system_message(self) -> str:
+        """Render the IntuneExpert system message, including the current scenario summary"""
+        return f"""
         You are an Intune Expert agent specializing in Microsoft Intune diagnostics and troubleshooting.
         
         Your role is to interpret natural language requests from support engineers and execute the appropriate
@@ -560,6 +570,16 @@ class AgentService:
         
         Always rely on instructions.md for the correct Kusto queries and use your MCP tools to execute them.
         """
+    
+    async def create_intune_expert_agent(self, model_config: ModelConfiguration) -> AssistantAgent:
+        """Create the IntuneExpert agent with Kusto MCP tools access"""
+        logger.info("Creating Intune Expert agent with Kusto MCP tools")
+        model_client = self._create_azure_model_client(model_config)
+        
+        # The rendered prompt embeds the scenario summary; build it once per scenario load
+        if self._system_message_cache is None:
+            self._system_message_cache = self._render_system_message()
+        system_message = self._system_message_cache
         
         # Discover and create tools from MCP server
         tools = await self._discover_mcp_tools()
@@ -610,13 +630,16 @@ class AgentService:
         naive regex splitting for concatenated tool outputs.
         """
         results: list[Any] = []
-        if not text or ('{' not in text and '[' not in text):
+        # One search both rules out bracket-free text and skips the prose before the first opener
+        first_open = _JSON_OPEN_RE.search(text) if text else None
+        if first_open is None:
             return results
         start_idx: int | None = None
         depth = 0
         in_string = False
         escape = False
-        for i, ch in enumerate(text):
+        first = first_open.start()
+        for i, ch in enumerate(itertools.islice(text, first, None), first):
             if start_idx is None:
                 if ch in '{[':
                     start_idx = i
@@ -987,14 +1010,10 @@ STRICT RESPONSE CONSTRAINTS:
         guid_match = re.search(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b", message)
         
         # Check for scenario references using the new service
-        scenario_titles = self.scenario_service.list_all_scenario_titles()
-        if scenario_titles:
-            message_lower = message.lower()
-            for title in scenario_titles:
-                title_lower = title.lower()
-                if title_lower and (title_lower in message_lower or any(word in title_lower for word in message_lower.split() if len(word) > 3)):
-                    logger.info(f"Scenario match found: {title}")
-                    return await self.query_diagnostics("scenario", {"scenario": title})
+        title = self.scenario_service.match_scenario_title(message)
+        if title:
+            logger.info(f"Scenario match found: {title}")
+            return await self.query_diagnostics("scenario", {"scenario": title})
         
         # Simple intent mapping as fallback
         intent_keywords = {
@@ -1007,9 +1026,11 @@ STRICT RESPONSE CONSTRAINTS:
             "mam_policy": ["mam", "mobile", "management"]
         }
         
+        # Lowercase once rather than once per keyword probe
+        message_lower = message.lower()
         detected_intent = None
         for intent, keywords in intent_keywords.items():
-            if any(keyword in message.lower() for keyword in keywords):
+            if any(keyword in message_lower for keyword in keywords):
                 detected_intent = intent
                 break
         
@@ -173,8 +173,13 @@ class KustoMCPService:
                 if not combined:
                     return {"success": True, "table": {"columns": ["Content"], "rows": [[str(result.content[0])]], "total_rows": 1}}
 
-                # Check for error messages first
-                if combined.startswith("Error") or "failed" in combined.lower() or "status code" in combined.lower():
+                # Check for error messages first (lowercase the possibly large payload only once)
+                if combined.startswith("Error"):
+                    is_error = True
+                else:
+                    combined_lower = combined.lower()
+                    is_error = "failed" in combined_lower or "status code" in combined_lower
+                if is_error:
                     logger.error(f"MCP server returned error: {combined}")
                     return {"success": False, "error": combined}
 
@@ -280,23 +285,25 @@ class KustoMCPService:
             logger.info("Skipping prewarm: 'list_tables' tool not available yet")
             return
 
-        # Deduplicate by cluster only (one auth prompt per cluster)
-        seen_clusters: set[str] = set()
+        # Deduplicate by cluster only (one auth prompt per cluster); first database seen wins
+        targets: Dict[str, Tuple[str, str]] = {}
         for cluster_url, database in cluster_db_pairs:
             # Normalize cluster URL for uniqueness
             if not re.match(r"^https?://", cluster_url, re.IGNORECASE):
                 cluster_url_norm = f"https://{cluster_url.strip()}".rstrip('/')
             else:
                 cluster_url_norm = cluster_url.rstrip('/')
-            host_key = cluster_url_norm.lower()
-            if host_key in seen_clusters:
-                continue
-            seen_clusters.add(host_key)
+            targets.setdefault(cluster_url_norm.lower(), (cluster_url_norm, database))
+
+        async def prewarm_cluster(cluster_url_norm: str, database: str) -> None:
             try:
                 await self._session.call_tool("list_tables", {"clusterUrl": cluster_url_norm, "database": database})
                 logger.info(f"MCP prewarm list_tables (single per cluster) success: {cluster_url_norm}")
             except Exception as e:  # noqa: BLE001
                 logger.warning(f"MCP prewarm list_tables failed for {cluster_url_norm}: {e}")
+
+        # Clusters are independent, so open them concurrently; startup waits for the slowest only
+        await asyncio.gather(*(prewarm_cluster(url, db) for url, db in targets.values()))
 # Global MCP service instance
 kusto_mcp_service: Optional[KustoMCPService] = None
 
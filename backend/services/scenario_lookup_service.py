@@ -7,7 +7,7 @@ without loading the entire file into the agent's system prompt.
 
 import logging
 from pathlib import Path
-from typing import Dict, List, Optional, Set
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 from dataclasses import dataclass, field
 from services.instructions_parser import parse_instructions
 
@@ -48,6 +48,10 @@ class ScenarioLookupService:
         self.scenario_lookup: Dict[str, ScenarioInfo] = {}
         self.keyword_index: Dict[str, Set[str]] = {}  # keyword -> set of scenario titles
         self._load_scenarios()
+        # (lowercase title, title) pairs in instructions order, for substring title matching
+        self.title_index: List[Tuple[str, str]] = [
+            (title.lower(), title) for title in self.list_all_scenario_titles()
+        ]
     
     def _load_scenarios(self) -> None:
         """Load and index scenarios from instructions.md"""
@@ -378,9 +382,28 @@ class ScenarioLookupService:
     def list_all_scenario_titles(self) -> List[str]:
         """Get list of all available scenario titles"""
         return [scenario.title for scenario in self.scenario_lookup.values()]
+    
+    def iter_scenarios(self) -> Iterator[DetailedScenario]:
+        """Iterate over all detailed scenarios in instructions order"""
+        return iter(self.scenarios_index.values())
+    
+    def match_scenario_title(self, message: str) -> Optional[str]:
+        """Return the first scenario title referenced by a free-text message, if any.
+        
+        A title matches when it appears in the message, or when any message word longer
+        than three characters appears within the title.
+        """
+        message_lower = message.lower()
+        words = [word for word in message_lower.split() if len(word) > 3]
+        for title_lower, title in self.title_index:
+            if title_lower and (title_lower in message_lower or any(word in title_lower for word in words)):
+                return title
+        return None
 
 # Global service instance
 _scenario_service: Optional[ScenarioLookupService] = None
+# Set once reload_scenarios() has run in this process
+_loaded: bool = False
 
 def get_scenario_service() -> ScenarioLookupService:
     """Get the global scenario lookup service instance"""
@@ -392,6 +415,12 @@ def get_scenario_service() -> ScenarioLookupService:
 
 def reload_scenarios() -> None:
     """Reload scenarios (useful for development/testing)"""
-    global _scenario_service
+    global _scenario_service, _loaded
     _scenario_service = None
-    get_scenario_service()
\ No newline at end of file
+    get_scenario_service()
+    _loaded = True
+
+def ensure_scenarios_loaded() -> None:
+    """Reload scenarios once per process; later calls are no-ops (use reload_scenarios to force)"""
+    if not _loaded:
+        reload_scenarios()
\ No newline at end of file